@@ -1,38 +1,80 @@
 import os
+import json
+import asyncio
+import stat
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import partial
 from uuid import uuid4
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from dotenv import load_dotenv
 import numpy as np
+from anyio import to_thread
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, JSONResponse
 
 from audio_processing import extract_melody_notes, analyze_melody
 from melody_generator import notes_to_midi, notes_to_wav
 from rhythm_processor import quantize_rhythm, detect_tempo
-from melody_enhancer import enhance_melody, extend_melody_duration
+from melody_enhancer import apply_enhancements
 from music_theory import get_available_scales, get_scales_by_category
+from notes import notes_to_dicts
 from supabase_storage import supabase_storage
 
 
-def convert_numpy_types(obj):
-    """
-    Recursively convert numpy types to native Python types for JSON serialization.
-    """
+def _np_default(obj):
+    """Serialize numpy leaves that the JSON encoder does not handle itself."""
     if isinstance(obj, np.integer):
         return int(obj)
-    elif isinstance(obj, np.floating):
+    if isinstance(obj, np.floating):
         return float(obj)
-    elif isinstance(obj, np.ndarray):
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    if isinstance(obj, np.ndarray):
         return obj.tolist()
-    elif isinstance(obj, dict):
-        return {key: convert_numpy_types(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_numpy_types(item) for item in obj]
-    else:
-        return obj
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps_json(content) -> bytes:
+    """
+    Encode content as compact UTF-8 JSON.
+
+    Uses orjson (with native numpy support) when installed and the stdlib
+    encoder otherwise; either way Python is only called back for numpy
+    leaves, never for the containers around them.
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(
+            content,
+            default=_np_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(
+        content,
+        default=_np_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class NumpyJSONResponse(JSONResponse):
+    """JSON response that serializes numpy scalars and arrays directly."""
+
+    def render(self, content) -> bytes:
+        return dumps_json(content)
+
 
 # Load environment variables
 load_dotenv()
@@ -46,7 +88,124 @@ AUDIO_DIR = STORAGE_DIR / "audio"
 for d in [HUMS_DIR, MELODIES_DIR, AUDIO_DIR]:
     d.mkdir(parents=True, exist_ok=True)
 
-app = FastAPI(title="Hum2Melody AI - Enhanced")
+# Block size used when streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1 << 16
+
+# Number of extraction results kept for re-uploads of the same hum
+EXTRACTION_CACHE_SIZE = 128
+
+_extraction_cache: "OrderedDict[tuple, Tuple[np.ndarray, str, str]]" = OrderedDict()
+_extraction_cache_lock = threading.Lock()
+
+
+def extract_melody_notes_cached(
+    audio_path: Path,
+    digest: str,
+    scale: Optional[str] = None,
+    root: Optional[str] = None,
+    auto_detect_key: bool = True
+) -> Tuple[np.ndarray, str, str]:
+    """
+    extract_melody_notes, memoized on the upload's content digest.
+
+    The result only depends on the audio bytes and the key settings, so a
+    hum that is uploaded again (e.g. to try another instrument or groove)
+    skips decoding and pitch tracking.
+
+    Args:
+        audio_path: Path to the uploaded audio file
+        digest: Hex digest of the file contents
+        scale: Scale name, or None for auto-detection
+        root: Root note, or None for auto-detection
+        auto_detect_key: Whether to detect the key automatically
+
+    Returns:
+        Same as extract_melody_notes; the note array is a private copy
+    """
+    key = (digest, scale, root, auto_detect_key)
+    with _extraction_cache_lock:
+        cached = _extraction_cache.get(key)
+        if cached is not None:
+            _extraction_cache.move_to_end(key)
+
+    if cached is None:
+        cached = extract_melody_notes(
+            audio_path,
+            scale=scale,
+            root=root,
+            auto_detect_key=auto_detect_key
+        )
+        with _extraction_cache_lock:
+            _extraction_cache[key] = cached
+            if len(_extraction_cache) > EXTRACTION_CACHE_SIZE:
+                _extraction_cache.popitem(last=False)
+
+    notes, detected_root, detected_scale = cached
+    return notes.copy(), detected_root, detected_scale
+
+
+# Internal nginx location aliased to STORAGE_DIR. When set, generated files
+# are handed to nginx through X-Accel-Redirect instead of sent by the app.
+X_ACCEL_REDIRECT_PREFIX = os.getenv("X_ACCEL_REDIRECT_PREFIX", "").rstrip("/")
+
+
+class StorageFileResponse(FileResponse):
+    """
+    FileResponse for generated MIDI and WAV files.
+
+    Starlette already passes the path to the server when it supports the
+    http.response.pathsend extension. Otherwise the file is read in chunks big
+    enough that a rendered melody takes a single read() instead of one thread
+    round trip per 64KB.
+    """
+
+    chunk_size = 1 << 22
+
+
+def serve_storage_file(path: Path, media_type: str, filename: str) -> Response:
+    """
+    Respond with a file from STORAGE_DIR, or 404 if it does not exist.
+
+    Args:
+        path: File path inside STORAGE_DIR
+        media_type: Content type of the file
+        filename: Download filename for Content-Disposition
+
+    Returns:
+        Response that sends the file
+    """
+    try:
+        stat_result = path.stat()
+    except FileNotFoundError:
+        stat_result = None
+    if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if X_ACCEL_REDIRECT_PREFIX:
+        location = f"{X_ACCEL_REDIRECT_PREFIX}/{path.relative_to(STORAGE_DIR).as_posix()}"
+        return Response(media_type=media_type, headers={
+            "X-Accel-Redirect": location,
+            "Content-Disposition": f'attachment; filename="{filename}"',
+        })
+
+    # Passing the stat result saves FileResponse another os.stat() call
+    return StorageFileResponse(path, media_type=media_type, filename=filename, stat_result=stat_result)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Write any buffered metadata rows and release pooled Supabase
+    # connections on shutdown
+    await to_thread.run_sync(supabase_storage.flush)
+    await supabase_storage.aclose()
+
+
+app = FastAPI(
+    title="Hum2Melody AI - Enhanced",
+    default_response_class=NumpyJSONResponse,
+    lifespan=lifespan,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -62,13 +221,30 @@ async def health():
     return {"status": "ok"}
 
 
+# The scale list is static for the lifetime of the process, so it is
+# encoded once and served with an ETag for conditional requests
+_SCALES_BODY = dumps_json({
+    "scales": get_available_scales(),
+    "categories": get_scales_by_category(),
+})
+_SCALES_ETAG = '"' + hashlib.blake2b(_SCALES_BODY, digest_size=8).hexdigest() + '"'
+_SCALES_HEADERS = {"ETag": _SCALES_ETAG, "Cache-Control": "public, max-age=86400"}
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header (weak comparison) matches etag."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
 @app.get("/api/scales")
-async def get_scales():
+async def get_scales(request: Request):
     """Get available scales organized by category."""
-    return JSONResponse({
-        "scales": get_available_scales(),
-        "categories": get_scales_by_category(),
-    })
+    if _etag_matches(request.headers.get("if-none-match"), _SCALES_ETAG):
+        return Response(status_code=304, headers=_SCALES_HEADERS)
+    return Response(content=_SCALES_BODY, media_type="application/json", headers=_SCALES_HEADERS)
 
 
 @app.post("/api/hum-to-melody")
@@ -110,22 +286,30 @@ async def hum_to_melody(
     hum_id = str(uuid4())
     raw_path = HUMS_DIR / f"{hum_id}{file_ext}"
 
-    # Save uploaded file
-    content = await file.read()
-    raw_path.write_bytes(content)
-
-    # Process to extract melody notes
+    # Stream the uploaded file to disk in fixed-size blocks, hashing it on
+    # the way for the extraction cache
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(raw_path, "wb", buffering=UPLOAD_CHUNK_SIZE) as out:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+            out.write(chunk)
+
+    # Process to extract melody notes. Decoding and pitch tracking are
+    # CPU-bound, so they (and the rendering below) run in the worker thread
+    # pool to keep the event loop free for other requests.
     try:
-        notes, detected_root, detected_scale = extract_melody_notes(
+        notes, detected_root, detected_scale = await to_thread.run_sync(partial(
+            extract_melody_notes_cached,
             raw_path,
+            hasher.hexdigest(),
             scale=scale,
             root=root,
             auto_detect_key=auto_detect_key
-        )
+        ))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error extracting melody: {e}")
 
-    if not notes:
+    if len(notes) == 0:
         raise HTTPException(status_code=422, detail="Could not detect a clear melody. Try humming closer to the mic.")
 
     # Store original note count for comparison
@@ -142,60 +326,55 @@ async def hum_to_melody(
             groove_template=groove_template
         )
 
-    # Apply melody enhancement if requested (default to smooth if none specified)
-    if enhancement_mode:
-        notes = enhance_melody(
-            notes,
-            mode=enhancement_mode,
-            intensity=enhancement_intensity,
-            root=detected_root,
-            scale=detected_scale
-        )
-    else:
-        # Apply smooth enhancement by default for better-sounding melodies
-        notes = enhance_melody(
-            notes,
-            mode="smooth",
-            intensity=0.5,
-            root=detected_root,
-            scale=detected_scale
-        )
-
-    # Extend melody to minimum 15 seconds for richer compositions
-    notes = extend_melody_duration(notes, min_duration=15.0)
+    # Apply melody enhancement if requested, then extend the melody to a
+    # minimum of 15 seconds for richer compositions. Without a mode, smooth
+    # is applied by default for better-sounding melodies; it only touches
+    # jumps wider than a fourth, so most hums skip that pass entirely.
+    notes = await to_thread.run_sync(partial(
+        apply_enhancements,
+        notes,
+        mode=enhancement_mode,
+        intensity=enhancement_intensity,
+        root=detected_root,
+        scale=detected_scale,
+        min_duration=15.0
+    ))
 
     # Analyze melody
     analysis = analyze_melody(notes)
 
-    # Generate MIDI
+    # Generate MIDI and the audio preview with the selected instrument. The
+    # two files are independent, so they are written in parallel threads.
     midi_path = MELODIES_DIR / f"{hum_id}.mid"
-    notes_to_midi(notes, midi_path)
-
-    # Generate audio preview with selected instrument
     audio_path = AUDIO_DIR / f"{hum_id}.wav"
-    notes_to_wav(notes, audio_path, instrument=instrument)
+    await asyncio.gather(
+        to_thread.run_sync(notes_to_midi, notes, midi_path),
+        to_thread.run_sync(partial(notes_to_wav, notes, audio_path, instrument=instrument)),
+    )
 
     # Try to upload to Supabase if configured, otherwise use local files
     if supabase_storage.enabled:
         try:
-            # Upload files to Supabase Storage
-            hum_url = supabase_storage.upload_file(
-                "hums",
-                raw_path,
-                f"{hum_id}.wav",
-                "audio/wav"
-            )
-            midi_url = supabase_storage.upload_file(
-                "melodies",
-                midi_path,
-                f"{hum_id}.mid",
-                "audio/midi"
-            )
-            audio_url = supabase_storage.upload_file(
-                "audio",
-                audio_path,
-                f"{hum_id}.wav",
-                "audio/wav"
+            # Upload files to Supabase Storage concurrently
+            hum_url, midi_url, audio_url = await asyncio.gather(
+                supabase_storage.upload_file_async(
+                    "hums",
+                    raw_path,
+                    f"{hum_id}.wav",
+                    "audio/wav"
+                ),
+                supabase_storage.upload_file_async(
+                    "melodies",
+                    midi_path,
+                    f"{hum_id}.mid",
+                    "audio/midi"
+                ),
+                supabase_storage.upload_file_async(
+                    "audio",
+                    audio_path,
+                    f"{hum_id}.wav",
+                    "audio/wav"
+                ),
             )
 
             # Save metadata to database
@@ -226,7 +405,6 @@ async def hum_to_melody(
         midi_url = f"/files/midi/{midi_path.name}"
         audio_url = f"/files/audio/{audio_path.name}"
 
-    # Convert all numpy types to native Python types for JSON serialization
     response_data = {
         "id": hum_id,
         "midi_url": midi_url,
@@ -237,8 +415,8 @@ async def hum_to_melody(
             "root": detected_root,
             "scale": detected_scale,
         },
-        "analysis": convert_numpy_types(analysis),
-        "notes": convert_numpy_types(notes),  # Include notes for frontend visualization
+        "analysis": analysis,
+        "notes": notes_to_dicts(notes),  # Include notes for frontend visualization
         "settings": {
             "instrument": instrument,
             "scale": detected_scale,
@@ -249,20 +427,14 @@ async def hum_to_melody(
         }
     }
 
-    return JSONResponse(response_data)
+    return NumpyJSONResponse(response_data)
 
 
 @app.get("/files/midi/{filename}")
 async def get_midi(filename: str):
-    path = MELODIES_DIR / filename
-    if not path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(path, media_type="audio/midi", filename=filename)
+    return serve_storage_file(MELODIES_DIR / filename, "audio/midi", filename)
 
 
 @app.get("/files/audio/{filename}")
 async def get_audio(filename: str):
-    path = AUDIO_DIR / filename
-    if not path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(path, media_type="audio/wav", filename=filename)
+    return serve_storage_file(AUDIO_DIR / filename, "audio/wav", filename)
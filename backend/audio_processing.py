@@ -1,9 +1,48 @@
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import Dict, Tuple, Optional
 
 import numpy as np
 import librosa
-from music_theory import quantize_to_scale, detect_key
+import soundfile as sf
+from music_theory import scale_lut, detect_key
+from notes import empty_notes
+
+try:
+    from pitch_nccf import nccf_pitch
+    NCCF_AVAILABLE = True
+except ImportError:
+    NCCF_AVAILABLE = False
+
+
+# Analysis settings for pitch tracking
+_SR = 22050
+_HOP = 512
+_FRAME = 2048
+_HOP_T = _HOP / _SR  # seconds per frame
+
+# Pitch search range, librosa.note_to_hz("C2") and librosa.note_to_hz("C7")
+_FMIN_HZ = 65.40639132514966
+_FMAX_HZ = 2093.004522404789
+
+
+def _load_audio(path: Path) -> np.ndarray:
+    """
+    Decode an audio file to a mono float32 signal at _SR.
+
+    Formats libsndfile understands (WAV, FLAC, OGG...) are read directly and
+    resampled only if needed; anything else goes through librosa.load.
+    """
+    try:
+        y, file_sr = sf.read(str(path), dtype="float32", always_2d=False)
+    except RuntimeError:
+        y, _ = librosa.load(path, sr=_SR, mono=True)
+        return y
+
+    if y.ndim == 2:
+        y = y.mean(axis=1)
+    if file_sr != _SR:
+        y = librosa.resample(y, orig_sr=file_sr, target_sr=_SR, res_type="soxr_qq")
+    return y
 
 
 def extract_melody_notes(
@@ -11,9 +50,9 @@ def extract_melody_notes(
     scale: Optional[str] = None,
     root: Optional[str] = None,
     auto_detect_key: bool = True
-) -> Tuple[List[Dict], str, str]:
+) -> Tuple[np.ndarray, str, str]:
     """
-    Load audio and extract a monophonic melody as a list of note dicts.
+    Load audio and extract a monophonic melody as a note array.
 
     Args:
         path: Path to audio file
@@ -23,68 +62,55 @@ def extract_melody_notes(
 
     Returns:
         Tuple of (notes, detected_root, detected_scale)
-        notes: List of {"midi": int, "start": float_sec, "end": float_sec}
+        notes: Structured array (NOTE_DTYPE) of midi, start and end (seconds)
         detected_root: Detected or provided root note
         detected_scale: Detected or provided scale name
     """
-    y, sr = librosa.load(path, sr=22050, mono=True)
-    y = librosa.util.normalize(y)
-
-    # Use librosa.yin for fundamental frequency estimation
-    f0 = librosa.yin(
-        y,
-        fmin=librosa.note_to_hz("C2"),
-        fmax=librosa.note_to_hz("C7"),
-        sr=sr,
-        frame_length=2048,
-        hop_length=512,
-    )
-
-    times = librosa.times_like(f0, sr=sr, hop_length=512)
-
-    # First pass: extract raw notes without quantization
-    raw_notes: List[Dict] = []
-    current_note = None
-
-    for t, freq in zip(times, f0):
-        if np.isnan(freq) or freq <= 0:
-            midi = None
-        else:
-            midi = int(round(librosa.hz_to_midi(float(freq))))
-
-        if midi is None:
-            # end current note if any
-            if current_note is not None:
-                current_note["end"] = float(t)
-                raw_notes.append(current_note)
-                current_note = None
-            continue
-
-        if current_note is None:
-            # start new note
-            current_note = {"midi": int(midi), "start": float(t), "end": float(t)}
-        else:
-            # continue same note or start new one if pitch changed
-            if midi == current_note["midi"]:
-                current_note["end"] = float(t)
-            else:
-                # close previous
-                current_note["end"] = float(t)
-                raw_notes.append(current_note)
-                # start new
-                current_note = {"midi": int(midi), "start": float(t), "end": float(t)}
-
-    # close last note
-    if current_note is not None:
-        current_note["end"] = float(times[-1])
-        raw_notes.append(current_note)
-
-    # filter very short notes
+    y = librosa.util.normalize(_load_audio(path))
+    sr = _SR
+
+    # Fundamental frequency estimation: the Numba NCCF tracker when
+    # available, librosa.yin otherwise
+    if NCCF_AVAILABLE:
+        f0 = nccf_pitch(y, sr, _FRAME, _HOP, _FMIN_HZ, _FMAX_HZ)
+    else:
+        f0 = librosa.yin(
+            y,
+            fmin=_FMIN_HZ,
+            fmax=_FMAX_HZ,
+            sr=sr,
+            frame_length=_FRAME,
+            hop_length=_HOP,
+        )
+
+    # First pass: extract raw notes without quantization.
+    # Convert every frame to MIDI in one vectorized step (unvoiced frames
+    # become -1) and find note runs from the indices where the pitch changes.
+    valid = np.isfinite(f0) & (f0 > 0)
+    midi = np.full(len(f0), -1, dtype=np.int16)
+    midi[valid] = np.round(12 * np.log2(f0[valid] / 440.0) + 69).astype(np.int16)
+
+    changes = np.flatnonzero(np.diff(np.concatenate(([-2], midi, [-2]))))
+    run_starts = changes[:-1]
+    run_ends = changes[1:]
+    run_midi = midi[run_starts]
+
+    # A note ends on the frame where the next run begins (or on the last
+    # frame); frame indices are only converted to seconds here
+    start_times = run_starts * _HOP_T
+    end_times = np.minimum(run_ends, len(f0) - 1) * _HOP_T
+
+    # filter unvoiced runs and very short notes
     min_duration = 0.08  # 80 ms
-    raw_notes = [n for n in raw_notes if (n["end"] - n["start"]) >= min_duration]
+    keep = (run_midi >= 0) & ((end_times - start_times) >= min_duration)
+
+    raw_notes = empty_notes(int(keep.sum()))
+    raw_notes["midi"] = run_midi[keep]
+    raw_notes["start"] = start_times[keep]
+    raw_notes["end"] = end_times[keep]
 
-    if not raw_notes:
-        return [], "C", "minor"
+    if len(raw_notes) == 0:
+        return raw_notes, "C", "minor"
 
     # Detect key if requested and not provided
     if auto_detect_key and (root is None or scale is None):
@@ -101,36 +127,28 @@ def extract_melody_notes(
             scale = "minor"
 
     # Second pass: quantize to detected/specified scale
-    notes = []
-    for note in raw_notes:
-        quantized_midi = quantize_to_scale(note["midi"], root, scale)
-        notes.append({
-            "midi": quantized_midi,
-            "start": note["start"],
-            "end": note["end"],
-        })
+    notes = raw_notes
+    notes["midi"] = scale_lut(root, scale)[np.clip(notes["midi"], 0, 127)]
 
     # shift notes to start at 0
-    if notes:
-        first_start = notes[0]["start"]
-        for n in notes:
-            n["start"] -= first_start
-            n["end"] -= first_start
+    first_start = notes["start"][0]
+    notes["start"] -= first_start
+    notes["end"] -= first_start
 
     return notes, root, scale
 
 
-def analyze_melody(notes: List[Dict]) -> Dict:
+def analyze_melody(notes: np.ndarray) -> Dict:
     """
     Analyze melody characteristics.
 
     Args:
-        notes: List of note dictionaries
+        notes: Note array (NOTE_DTYPE)
 
     Returns:
         Dictionary with analysis results
     """
-    if not notes:
+    if len(notes) == 0:
         return {
             "num_notes": 0,
             "duration": 0.0,
@@ -138,18 +156,18 @@ def analyze_melody(notes: List[Dict]) -> Dict:
             "avg_interval": 0.0,
         }
 
-    midis = [n["midi"] for n in notes]
-    duration = max(n["end"] for n in notes)
+    midis = notes["midi"].astype(np.int64)
+    lowest = int(midis.min())
+    highest = int(midis.max())
 
     # Calculate intervals
-    intervals = [abs(midis[i+1] - midis[i]) for i in range(len(midis) - 1)]
-    avg_interval = np.mean(intervals) if intervals else 0
+    avg_interval = float(np.abs(np.diff(midis)).mean()) if midis.size > 1 else 0.0
 
     return {
-        "num_notes": len(notes),
-        "duration": duration,
-        "pitch_range": max(midis) - min(midis),
+        "num_notes": int(midis.size),
+        "duration": float(notes["end"].max()),
+        "pitch_range": highest - lowest,
         "avg_interval": avg_interval,
-        "lowest_note": min(midis),
-        "highest_note": max(midis),
+        "lowest_note": lowest,
+        "highest_note": highest,
     }
@@ -1,23 +1,52 @@
 """
 Melody enhancement and transformation utilities.
 """
-from typing import List, Dict
+from typing import Optional
 import numpy as np
-from music_theory import quantize_to_scale, SCALES
+from music_theory import scale_lut, SCALES
+from notes import empty_notes
+
+
+# Shared generator for all randomized enhancements
+_rng = np.random.default_rng()
+
+# Transpositions used to vary repeated material (octaves, fifths, unison)
+_VARIATIONS = np.array([12, -12, 7, -7, 0], dtype=np.int8)
+
+
+def _run_positions(counts: np.ndarray) -> np.ndarray:
+    """Position of each element within its run for np.repeat(..., counts)."""
+    return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+def _harmony_voice(
+    notes: np.ndarray, midis: np.ndarray, delay: float, length: float
+) -> np.ndarray:
+    """Harmony notes, slightly offset in time for texture and shortened."""
+    voice = empty_notes(len(notes))
+    voice["midi"] = midis
+    voice["start"] = notes["start"] + delay
+    voice["end"] = notes["start"] + (notes["end"] - notes["start"]) * length
+    return voice
+
+
+def _sort_by_start(notes: np.ndarray) -> np.ndarray:
+    """Stable sort of a note array by start time."""
+    return notes[np.argsort(notes["start"], kind="stable")]
 
 
 def enhance_melody(
-    notes: List[Dict],
+    notes: np.ndarray,
     mode: str = "smooth",
     intensity: float = 0.7,
     root: str = "C",
     scale: str = "minor"
-) -> List[Dict]:
+) -> np.ndarray:
     """
     Transform a melody using various enhancement modes.
 
     Args:
-        notes: List of note dictionaries
+        notes: Note array (NOTE_DTYPE)
         mode: Enhancement mode - "smooth", "bounce", "trap_run", "afro_vibe", "choir"
         intensity: How much to apply the effect (0.0 - 1.0)
         root: Root note for scale-based transformations
@@ -26,8 +55,8 @@ def enhance_melody(
     Returns:
         Enhanced melody notes
     """
-    if not notes:
-        return []
+    if len(notes) == 0:
+        return notes
 
     enhancers = {
         "smooth": smooth_melody,
@@ -41,12 +70,30 @@ def enhance_melody(
     return enhancer(notes, intensity, root, scale)
 
 
+def has_large_jumps(notes: np.ndarray, max_interval: int = 5) -> bool:
+    """
+    Check whether any melodic interval is wider than max_interval semitones.
+
+    smooth_melody only changes such jumps, so callers can skip it otherwise.
+
+    Args:
+        notes: Note array (NOTE_DTYPE)
+        max_interval: Largest interval left untouched (default: a fourth)
+
+    Returns:
+        True if at least one jump exceeds max_interval
+    """
+    if len(notes) < 2:
+        return False
+    return bool(np.abs(np.diff(notes["midi"].astype(np.int64))).max() > max_interval)
+
+
 def smooth_melody(
-    notes: List[Dict],
+    notes: np.ndarray,
     intensity: float = 0.7,
     root: str = "C",
     scale: str = "minor"
-) -> List[Dict]:
+) -> np.ndarray:
     """
     Smooth out large melodic jumps, create more stepwise motion.
 
@@ -59,40 +106,39 @@ def smooth_melody(
     Returns:
         Smoothed melody
     """
-    if len(notes) < 2:
+    if not has_large_jumps(notes):
         return notes
 
-    smoothed = [notes[0].copy()]
+    # Each jump is measured from the already smoothed previous note, so
+    # this is a sequential recurrence over plain ints
+    lut = scale_lut(root, scale).tolist()
+    midis = notes["midi"].tolist()
+    prev_midi = midis[0]
 
-    for i in range(1, len(notes)):
-        prev_midi = smoothed[-1]["midi"]
-        curr_midi = notes[i]["midi"]
+    for i in range(1, len(midis)):
+        curr_midi = midis[i]
         interval = curr_midi - prev_midi
 
         # If jump is too large, reduce it
         if abs(interval) > 5:  # More than a fourth
             # Blend between original and smoothed
-            target_midi = prev_midi + np.sign(interval) * min(abs(interval), 3)
-            new_midi = int(curr_midi * (1 - intensity) + target_midi * intensity)
-            new_midi = quantize_to_scale(new_midi, root, scale)
-        else:
-            new_midi = curr_midi
-
-        smoothed.append({
-            "midi": new_midi,
-            "start": notes[i]["start"],
-            "end": notes[i]["end"],
-        })
+            step = 3 if interval > 0 else -3
+            new_midi = int(curr_midi * (1 - intensity) + (prev_midi + step) * intensity)
+            midis[i] = lut[min(max(new_midi, 0), 127)]
+
+        prev_midi = midis[i]
 
+    smoothed = notes.copy()
+    smoothed["midi"] = midis
     return smoothed
 
 
 def bounce_melody(
-    notes: List[Dict],
+    notes: np.ndarray,
     intensity: float = 0.7,
     root: str = "C",
     scale: str = "minor"
-) -> List[Dict]:
+) -> np.ndarray:
     """
     Create a bouncy, staccato feel with shorter notes.
 
@@ -105,30 +151,22 @@ def bounce_melody(
     Returns:
         Bouncy melody
     """
-    bouncy = []
-
-    for note in notes:
-        duration = note["end"] - note["start"]
-
-        # Shorten notes based on intensity
-        staccato_duration = duration * (1.0 - intensity * 0.7)
-        staccato_duration = max(0.05, staccato_duration)
+    bouncy = notes.copy()
+    duration = notes["end"] - notes["start"]
 
-        bouncy.append({
-            "midi": note["midi"],
-            "start": note["start"],
-            "end": note["start"] + staccato_duration,
-        })
+    # Shorten notes based on intensity
+    staccato_duration = np.maximum(0.05, duration * (1.0 - intensity * 0.7))
+    bouncy["end"] = notes["start"] + staccato_duration
 
     return bouncy
 
 
 def trap_run_melody(
-    notes: List[Dict],
+    notes: np.ndarray,
     intensity: float = 0.7,
     root: str = "C",
     scale: str = "minor"
-) -> List[Dict]:
+) -> np.ndarray:
     """
     Add melodic runs, slides, and triplets for trap style.
 
@@ -144,55 +182,47 @@ def trap_run_melody(
     if len(notes) < 2:
         return notes
 
-    trap_notes = []
+    midis = notes["midi"].astype(np.int64)
+    step = np.diff(midis)
+    interval = np.abs(step)
+    gap_time = notes["start"][1:] - notes["end"][:-1]
 
-    for i in range(len(notes) - 1):
-        curr_note = notes[i]
-        next_note = notes[i + 1]
+    # Add slide/run notes for large intervals, only if there's enough time
+    runs = np.flatnonzero(
+        (interval > 3)
+        & (_rng.random(len(interval)) < intensity)
+        & (gap_time > 0.15)
+    )
+    if runs.size == 0:
+        return notes.copy()
 
-        trap_notes.append(curr_note.copy())
+    num_fill_notes = np.minimum(3, interval[runs] // 2)
+    fill_duration = gap_time[runs] / (num_fill_notes + 1)
 
-        # Check if there's a large interval
-        interval = abs(next_note["midi"] - curr_note["midi"])
+    # Create ascending or descending run
+    direction = np.sign(step[runs])
+    step_size = interval[runs] // (num_fill_notes + 1)
 
-        # Add slide/run notes for large intervals
-        if interval > 3 and np.random.random() < intensity:
-            gap_time = next_note["start"] - curr_note["end"]
+    # One row per fill note, j is its position within the run
+    owner = np.repeat(np.arange(runs.size), num_fill_notes)
+    j = _run_positions(num_fill_notes)
 
-            # Only add runs if there's enough time
-            if gap_time > 0.15:
-                num_fill_notes = min(3, interval // 2)
-                fill_duration = gap_time / (num_fill_notes + 1)
+    fills = empty_notes(owner.size)
+    fill_midi = midis[runs][owner] + direction[owner] * step_size[owner] * (j + 1)
+    fills["midi"] = scale_lut(root, scale)[np.clip(fill_midi, 0, 127)]
+    fills["start"] = notes["end"][runs][owner] + fill_duration[owner] * j
+    fills["end"] = fills["start"] + fill_duration[owner] * 0.7  # Short notes
 
-                # Create ascending or descending run
-                direction = 1 if next_note["midi"] > curr_note["midi"] else -1
-                step_size = interval // (num_fill_notes + 1)
-
-                for j in range(num_fill_notes):
-                    fill_midi = curr_note["midi"] + direction * step_size * (j + 1)
-                    fill_midi = quantize_to_scale(fill_midi, root, scale)
-
-                    fill_start = curr_note["end"] + fill_duration * j
-                    fill_end = fill_start + fill_duration * 0.7  # Short notes
-
-                    trap_notes.append({
-                        "midi": fill_midi,
-                        "start": fill_start,
-                        "end": fill_end,
-                    })
-
-    # Add the last note
-    trap_notes.append(notes[-1].copy())
-
-    return trap_notes
+    # Runs go between each note and the one after it
+    return np.insert(notes, np.repeat(runs + 1, num_fill_notes), fills)
 
 
 def afro_vibe_melody(
-    notes: List[Dict],
+    notes: np.ndarray,
     intensity: float = 0.7,
     root: str = "C",
     scale: str = "minor"
-) -> List[Dict]:
+) -> np.ndarray:
     """
     Add Afrobeat syncopation and rhythmic stagger.
 
@@ -205,51 +235,48 @@ def afro_vibe_melody(
     Returns:
         Afrobeat-style melody
     """
-    afro_notes = []
-
-    for i, note in enumerate(notes):
-        new_note = note.copy()
-
-        # Add syncopation - shift some notes slightly off-beat
-        if i % 2 == 1 and intensity > 0.3:  # Odd-numbered notes
-            # Detect beat (assume 120 BPM default)
-            beat_duration = 0.5  # seconds
-            grid_size = beat_duration / 4  # 16th notes
-
-            # Shift forward slightly
-            offset = grid_size * 0.3 * intensity
-            new_note["start"] += offset
-            new_note["end"] += offset
-
-        # Occasionally add repetition/stutter
-        if intensity > 0.6 and i < len(notes) - 1:
-            gap = notes[i + 1]["start"] - note["end"]
-            if gap > 0.2 and np.random.random() < 0.3:
-                # Add a repeated note
-                repeat_duration = min(0.1, gap * 0.4)
-                repeat_note = {
-                    "midi": note["midi"],
-                    "start": note["end"] + gap * 0.3,
-                    "end": note["end"] + gap * 0.3 + repeat_duration,
-                }
-                afro_notes.append(new_note)
-                afro_notes.append(repeat_note)
-                continue
-
-        afro_notes.append(new_note)
-
-    # Sort by start time
-    afro_notes.sort(key=lambda n: n["start"])
+    return _sort_by_start(_afro_vibe(notes, intensity, root, scale))
+
+
+def _afro_vibe(
+    notes: np.ndarray, intensity: float, root: str, scale: str
+) -> np.ndarray:
+    """afro_vibe_melody without the final sort by start time."""
+    afro_notes = notes.copy()
+
+    # Add syncopation - shift some notes slightly off-beat
+    if intensity > 0.3:
+        # Detect beat (assume 120 BPM default)
+        beat_duration = 0.5  # seconds
+        grid_size = beat_duration / 4  # 16th notes
+
+        # Shift odd-numbered notes forward slightly
+        offset = grid_size * 0.3 * intensity
+        afro_notes["start"][1::2] += offset
+        afro_notes["end"][1::2] += offset
+
+    # Occasionally add repetition/stutter
+    if intensity > 0.6 and len(notes) > 1:
+        gap = notes["start"][1:] - notes["end"][:-1]
+        stutter = np.flatnonzero((gap > 0.2) & (_rng.random(len(gap)) < 0.3))
+
+        # Add a repeated note after each stuttered one
+        repeat_duration = np.minimum(0.1, gap[stutter] * 0.4)
+        repeats = empty_notes(stutter.size)
+        repeats["midi"] = notes["midi"][stutter]
+        repeats["start"] = notes["end"][stutter] + gap[stutter] * 0.3
+        repeats["end"] = repeats["start"] + repeat_duration
+        afro_notes = np.insert(afro_notes, stutter + 1, repeats)
 
     return afro_notes
 
 
 def choir_harmony(
-    notes: List[Dict],
+    notes: np.ndarray,
     intensity: float = 0.7,
     root: str = "C",
     scale: str = "minor"
-) -> List[Dict]:
+) -> np.ndarray:
     """
     Add harmonies to create a choir effect (still monophonic, but with chord tones).
 
@@ -262,66 +289,50 @@ def choir_harmony(
     Returns:
         Notes with harmony tones added in sequence
     """
-    harmony_notes = []
-
-    for note in notes:
-        # Keep original melody note
-        harmony_notes.append(note.copy())
-
-        # Add harmony notes based on intensity
-        if intensity > 0.3:
-            # Add third above
-            third_up = note["midi"] + 3  # Minor third
-            if scale in ["major", "major_pentatonic", "lydian", "mixolydian"]:
-                third_up = note["midi"] + 4  # Major third
-
-            third_up = quantize_to_scale(third_up, root, scale)
-
-            # Create harmony note (slightly offset in time for texture)
-            harmony_duration = (note["end"] - note["start"]) * 0.8
-            harmony_notes.append({
-                "midi": third_up,
-                "start": note["start"] + 0.02,  # Slight delay
-                "end": note["start"] + harmony_duration,
-            })
-
-        if intensity > 0.6:
-            # Add fifth above
-            fifth_up = note["midi"] + 7
-            fifth_up = quantize_to_scale(fifth_up, root, scale)
-
-            harmony_duration = (note["end"] - note["start"]) * 0.7
-            harmony_notes.append({
-                "midi": fifth_up,
-                "start": note["start"] + 0.04,
-                "end": note["start"] + harmony_duration,
-            })
-
-        if intensity > 0.8:
-            # Add octave
-            octave_up = note["midi"] + 12
-            octave_up = min(127, octave_up)  # Stay within MIDI range
-
-            harmony_duration = (note["end"] - note["start"]) * 0.9
-            harmony_notes.append({
-                "midi": octave_up,
-                "start": note["start"] + 0.01,
-                "end": note["start"] + harmony_duration,
-            })
-
-    # Sort by start time
-    harmony_notes.sort(key=lambda n: n["start"])
-
-    return harmony_notes
+    return _sort_by_start(_choir_voices(notes, intensity, root, scale))
+
+
+def _choir_voices(
+    notes: np.ndarray, intensity: float, root: str, scale: str
+) -> np.ndarray:
+    """choir_harmony without the final sort by start time."""
+    # Keep original melody notes
+    voices = [notes]
+
+    lut = scale_lut(root, scale)
+    midis = notes["midi"].astype(np.int64)
+
+    # Add harmony notes based on intensity
+    if intensity > 0.3:
+        # Add third above
+        third = 3  # Minor third
+        if scale in ["major", "major_pentatonic", "lydian", "mixolydian"]:
+            third = 4  # Major third
+
+        third_up = lut[np.clip(midis + third, 0, 127)]
+        voices.append(_harmony_voice(notes, third_up, 0.02, 0.8))
+
+    if intensity > 0.6:
+        # Add fifth above
+        fifth_up = lut[np.clip(midis + 7, 0, 127)]
+        voices.append(_harmony_voice(notes, fifth_up, 0.04, 0.7))
+
+    if intensity > 0.8:
+        # Add octave, staying within MIDI range
+        octave_up = np.minimum(127, midis + 12)
+        voices.append(_harmony_voice(notes, octave_up, 0.01, 0.9))
+
+    # Interleave the voices note by note
+    return np.stack(voices, axis=1).ravel()
 
 
 def add_ornamentation(
-    notes: List[Dict],
+    notes: np.ndarray,
     style: str = "trill",
     density: float = 0.5,
     root: str = "C",
     scale: str = "minor"
-) -> List[Dict]:
+) -> np.ndarray:
     """
     Add ornamental notes (trills, grace notes, etc.).
 
@@ -344,72 +355,61 @@ def add_ornamentation(
 
 
 def add_grace_notes(
-    notes: List[Dict],
+    notes: np.ndarray,
     density: float,
     root: str,
     scale: str
-) -> List[Dict]:
+) -> np.ndarray:
     """Add quick grace notes before main notes."""
-    ornamented = []
-
-    for note in notes:
-        # Randomly add grace note based on density
-        if np.random.random() < density:
-            grace_duration = 0.05
-            grace_midi = note["midi"] + 1  # Upper neighbor
-            grace_midi = quantize_to_scale(grace_midi, root, scale)
+    # Randomly add grace note based on density
+    graced = np.flatnonzero(_rng.random(len(notes)) < density)
 
-            ornamented.append({
-                "midi": grace_midi,
-                "start": max(0, note["start"] - grace_duration),
-                "end": note["start"],
-            })
+    grace_duration = 0.05
+    grace = empty_notes(graced.size)
+    grace_midi = notes["midi"][graced].astype(np.int64) + 1  # Upper neighbor
+    grace["midi"] = scale_lut(root, scale)[np.clip(grace_midi, 0, 127)]
+    grace["start"] = np.maximum(0, notes["start"][graced] - grace_duration)
+    grace["end"] = notes["start"][graced]
 
-        ornamented.append(note.copy())
-
-    return ornamented
+    return np.insert(notes, graced, grace)
 
 
 def add_trills(
-    notes: List[Dict],
+    notes: np.ndarray,
     density: float,
     root: str,
     scale: str
-) -> List[Dict]:
+) -> np.ndarray:
     """Add trills to longer notes."""
-    ornamented = []
+    duration = notes["end"] - notes["start"]
+    trill_duration = 0.06
 
-    for note in notes:
-        duration = note["end"] - note["start"]
+    # Only trill on longer notes; each one is split into num_trills notes
+    trilled = (duration > 0.3) & (_rng.random(len(notes)) < density)
+    counts = np.where(trilled, (duration / trill_duration).astype(np.int64), 1)
 
-        # Only trill on longer notes
-        if duration > 0.3 and np.random.random() < density:
-            trill_duration = 0.06
-            num_trills = int(duration / trill_duration)
+    ornamented = np.repeat(notes, counts)
+    i = _run_positions(counts)
+    rows = np.repeat(trilled, counts)
 
-            # Alternate between main note and upper neighbor
-            upper_neighbor = quantize_to_scale(note["midi"] + 1, root, scale)
+    # Alternate between main note and upper neighbor
+    upper_midi = notes["midi"].astype(np.int64) + 1
+    upper_neighbor = scale_lut(root, scale)[np.clip(upper_midi, 0, 127)]
+    upper = rows & (i % 2 == 1)
+    ornamented["midi"][upper] = np.repeat(upper_neighbor, counts)[upper]
 
-            for i in range(num_trills):
-                trill_midi = note["midi"] if i % 2 == 0 else upper_neighbor
-                trill_start = note["start"] + i * trill_duration
-                trill_end = min(note["end"], trill_start + trill_duration)
-
-                ornamented.append({
-                    "midi": trill_midi,
-                    "start": trill_start,
-                    "end": trill_end,
-                })
-        else:
-            ornamented.append(note.copy())
+    trill_start = ornamented["start"] + i * trill_duration
+    trill_end = np.minimum(ornamented["end"], trill_start + trill_duration)
+    ornamented["start"][rows] = trill_start[rows]
+    ornamented["end"][rows] = trill_end[rows]
 
     return ornamented
 
 
 def extend_melody_duration(
-    notes: List[Dict],
+    notes: np.ndarray,
     min_duration: float = 15.0
-) -> List[Dict]:
+) -> np.ndarray:
     """
     Extend melody to minimum duration by repeating and varying the pattern.
 
@@ -420,41 +420,84 @@ def extend_melody_duration(
     Returns:
         Extended melody notes
     """
-    if not notes:
-        return []
+    return _sort_by_start(_repeat_to_duration(notes, min_duration))
+
+
+def _repeat_to_duration(notes: np.ndarray, min_duration: float) -> np.ndarray:
+    """extend_melody_duration without the final sort by start time."""
+    if len(notes) == 0:
+        return notes
 
     # Calculate current duration
-    current_duration = max(n["end"] for n in notes)
+    current_duration = notes["end"].max()
 
     # If already long enough, return as-is
     if current_duration >= min_duration:
         return notes
 
-    extended = notes.copy()
-    offset = current_duration
+    # Repeat the melody until we reach minimum duration, shifting each
+    # repetition by a whole number of melody lengths
+    n_reps = int(np.ceil((min_duration - current_duration) / current_duration))
+    repeats = np.tile(notes, n_reps)
+    offsets = np.repeat(np.arange(1, n_reps + 1) * current_duration, len(notes))
+    repeats["start"] += offsets
+    repeats["end"] += offsets
 
-    # Repeat the melody until we reach minimum duration
-    while offset < min_duration:
-        # Create a variation of the original melody
-        for note in notes:
-            new_note = note.copy()
-            new_note["start"] = note["start"] + offset
-            new_note["end"] = note["end"] + offset
+    # Add slight variation to avoid monotony
+    # Occasionally transpose by octave or fifth
+    varied = _rng.random(repeats.size) < 0.2
+    variation = _rng.choice(_VARIATIONS, size=int(varied.sum()))
+    repeats["midi"][varied] = np.clip(repeats["midi"][varied] + variation, 36, 96)
 
-            # Add slight variation to avoid monotony
-            # Occasionally transpose by octave or fifth
-            if np.random.random() < 0.2:
-                variation = np.random.choice([12, -12, 7, -7, 0])
-                new_note["midi"] = max(36, min(96, note["midi"] + variation))
+    extended = np.concatenate([notes, repeats])
 
-            extended.append(new_note)
+    # Trim notes that extend beyond min_duration
+    return extended[extended["start"] < min_duration]
 
-        offset += current_duration
 
-    # Trim notes that extend beyond min_duration
-    extended = [n for n in extended if n["start"] < min_duration]
+# Enhancement transforms that leave the final sort to apply_enhancements
+_UNSORTED_ENHANCERS = {
+    "smooth": smooth_melody,
+    "bounce": bounce_melody,
+    "trap_run": trap_run_melody,
+    "afro_vibe": _afro_vibe,
+    "choir": _choir_voices,
+}
+
+
+def apply_enhancements(
+    notes: np.ndarray,
+    mode: Optional[str] = None,
+    intensity: float = 0.7,
+    root: str = "C",
+    scale: str = "minor",
+    min_duration: float = 15.0
+) -> np.ndarray:
+    """
+    Run the whole enhancement stage: the selected mode, then extension to
+    min_duration, with a single sort by start time at the end.
+
+    Without a mode, large jumps are smoothed at intensity 0.5 instead.
+    Smoothing is never stacked on top of a user-selected enhancement.
+
+    Args:
+        notes: Note array (NOTE_DTYPE), sorted by start time
+        mode: Enhancement mode (see enhance_melody) or None
+        intensity: How much to apply the effect (0.0 - 1.0)
+        root: Root note for scale-based transformations
+        scale: Scale name for quantization
+        min_duration: Minimum duration in seconds (default: 15.0)
+
+    Returns:
+        Enhanced and extended melody notes
+    """
+    if len(notes) == 0:
+        return notes
 
-    # Sort by start time
-    extended.sort(key=lambda n: n["start"])
+    if mode:
+        enhancer = _UNSORTED_ENHANCERS.get(mode, smooth_melody)
+        notes = enhancer(notes, intensity, root, scale)
+    elif has_large_jumps(notes):
+        notes = smooth_melody(notes, 0.5, root, scale)
 
-    return extended
+    return _sort_by_start(_repeat_to_duration(notes, min_duration))
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import List, Dict
+from typing import Optional
 
 import numpy as np
 import mido
@@ -7,6 +7,17 @@ import wave
 import struct
 import math
 
+try:
+    from wavetable_synth import render_notes, onepole
+    WAVETABLE_KERNEL_AVAILABLE = True
+except ImportError:
+    from scipy.signal import lfilter
+    WAVETABLE_KERNEL_AVAILABLE = False
+
+
+# Shared generator for oscillator detuning
+_rng = np.random.default_rng()
+
 
 # Instrument definitions using harmonic profiles
 INSTRUMENTS = {
@@ -61,9 +72,29 @@ INSTRUMENTS = {
 }
 
 
-def notes_to_midi(notes: List[Dict], out_path: Path, tempo_bpm: int = 120) -> None:
+# Harmonic profiles as arrays: frequency multipliers and amplitudes, the
+# latter already divided by the number of harmonics
+HARMONIC_PROFILES = {
+    name: (
+        np.array([mult for mult, _ in config["harmonics"]], dtype=np.float32),
+        np.array([amp for _, amp in config["harmonics"]], dtype=np.float32) / len(config["harmonics"]),
+    )
+    for name, config in INSTRUMENTS.items()
+}
+
+# Samples rendered and written per block by notes_to_wav
+WAV_BLOCK_SIZE = 8192
+
+# Unit-period sine wavetable read by the oscillators. At 2**16 entries the
+# truncated-phase lookup stays about 80 dB below the signal, so no
+# interpolation is needed.
+WAVETABLE_SIZE = 1 << 16
+_SINE_TABLE = np.sin(2 * np.pi * np.arange(WAVETABLE_SIZE) / WAVETABLE_SIZE).astype(np.float32)
+
+
+def notes_to_midi(notes: np.ndarray, out_path: Path, tempo_bpm: int = 120) -> None:
     """
-    Convert list of notes ({midi, start, end}) to a simple monophonic MIDI file.
+    Convert a note array (NOTE_DTYPE) to a simple monophonic MIDI file.
     """
     mid = mido.MidiFile()
     track = mido.MidiTrack()
@@ -77,76 +108,137 @@ def notes_to_midi(notes: List[Dict], out_path: Path, tempo_bpm: int = 120) -> No
     ticks_per_second = ticks_per_beat / seconds_per_beat
 
     # sort by start time
-    notes_sorted = sorted(notes, key=lambda n: n["start"])
-    last_tick = 0
+    notes_sorted = notes[np.argsort(notes["start"], kind="stable")]
+
+    start_ticks = np.rint(notes_sorted["start"] * ticks_per_second).astype(np.int64)
+    end_ticks = np.rint(notes_sorted["end"] * ticks_per_second).astype(np.int64)
+    dur_ticks = np.maximum(1, end_ticks - start_ticks)
+
+    # The track is monophonic: each note_on follows the previous note_off,
+    # waiting until the note's own start (never negative for overlaps)
+    prev_ends = np.concatenate(([0], start_ticks[:-1] + dur_ticks[:-1]))
+    deltas = np.maximum(0, start_ticks - prev_ends)
+
+    midis = notes_sorted["midi"]
+    if len(midis) and (midis.min() < 0 or midis.max() > 127):
+        raise ValueError("MIDI note numbers must be in 0..127")
+
+    # Everything was validated above as whole arrays, so the per-message
+    # checks in mido are skipped
+    track.extend([
+        message
+        for midi, delta, duration in zip(midis.tolist(), deltas.tolist(), dur_ticks.tolist())
+        for message in (
+            mido.Message("note_on", skip_checks=True, note=midi, velocity=90, time=delta),
+            mido.Message("note_off", skip_checks=True, note=midi, velocity=0, time=duration),
+        )
+    ])
 
-    for n in notes_sorted:
-        start_sec = float(n["start"])
-        end_sec = float(n["end"])
-        dur_sec = max(0.05, end_sec - start_sec)
+    mid.save(out_path)
 
-        start_tick = int(round(start_sec * ticks_per_second))
-        end_tick = int(round(end_sec * ticks_per_second))
-        dur_ticks = max(1, end_tick - start_tick)
 
-        delta = max(0, start_tick - last_tick)
-        track.append(mido.Message("note_on", note=int(n["midi"]), velocity=90, time=delta))
-        track.append(mido.Message("note_off", note=int(n["midi"]), velocity=0, time=dur_ticks))
+def midi_to_freq(midi_note: int) -> float:
+    return 440.0 * (2.0 ** ((midi_note - 69) / 12.0))
 
-        last_tick = start_tick + dur_ticks
 
-    mid.save(out_path)
+# Shared [0, 1, 2, ...] ramp that envelope segments are scaled from
+_RAMP = np.arange(0, dtype=np.float32)
 
 
-def midi_to_freq(midi_note: int) -> float:
-    return 440.0 * (2.0 ** ((midi_note - 69) / 12.0))
+def _ramp(n: int) -> np.ndarray:
+    """First n values of the shared ramp, growing it when needed."""
+    global _RAMP
+    # Read the global once: another thread may swap it in between
+    ramp = _RAMP
+    if ramp.size < n:
+        ramp = _RAMP = np.arange(n, dtype=np.float32)
+    return ramp[:n]
 
 
-def generate_adsr_envelope(
-    length: int, sr: int, attack: float, decay: float, sustain: float, release: float
+def fill_adsr(
+    out: np.ndarray,
+    length: int,
+    sr: int,
+    attack: float,
+    decay: float,
+    sustain: float,
+    release: float
 ) -> np.ndarray:
     """
-    Generate an ADSR (Attack, Decay, Sustain, Release) envelope.
+    Write an ADSR (Attack, Decay, Sustain, Release) envelope into a buffer.
 
     Args:
+        out: Float32 buffer with room for at least length samples
         length: Total length in samples
         sr: Sample rate
         attack: Attack time in seconds
         decay: Decay time in seconds
         sustain: Sustain level (0-1)
         release: Release time in seconds
+
+    Returns:
+        View of the first length samples of out
     """
-    envelope = np.ones(length, dtype=np.float32)
+    envelope = out[:length]
+    envelope.fill(1.0)
 
     attack_samples = int(attack * sr)
     decay_samples = int(decay * sr)
     release_samples = int(release * sr)
 
-    # Attack phase
+    # Attack phase: 0 -> 1
     if attack_samples > 0 and attack_samples < length:
-        envelope[:attack_samples] = np.linspace(0.0, 1.0, attack_samples)
+        slope = 1.0 / (attack_samples - 1) if attack_samples > 1 else 0.0
+        np.multiply(_ramp(attack_samples), slope, out=envelope[:attack_samples])
 
-    # Decay phase
+    # Decay phase: 1 -> sustain
     if decay_samples > 0 and (attack_samples + decay_samples) < length:
         decay_start = attack_samples
         decay_end = attack_samples + decay_samples
-        envelope[decay_start:decay_end] = np.linspace(1.0, sustain, decay_samples)
+        slope = (sustain - 1.0) / (decay_samples - 1) if decay_samples > 1 else 0.0
+        segment = envelope[decay_start:decay_end]
+        np.multiply(_ramp(decay_samples), slope, out=segment)
+        segment += 1.0
 
-    # Sustain phase (already set to 1.0 by default, we scale later)
+    # Sustain phase
     sustain_start = attack_samples + decay_samples
     sustain_end = max(sustain_start, length - release_samples)
     if sustain_start < sustain_end:
         envelope[sustain_start:sustain_end] = sustain
 
-    # Release phase
+    # Release phase: sustain -> 0
     if release_samples > 0 and release_samples < length:
-        envelope[-release_samples:] = np.linspace(sustain, 0.0, release_samples)
+        slope = -sustain / (release_samples - 1) if release_samples > 1 else 0.0
+        segment = envelope[length - release_samples:]
+        np.multiply(_ramp(release_samples), slope, out=segment)
+        segment += sustain
 
     return envelope
 
 
+def generate_adsr_envelope(
+    length: int, sr: int, attack: float, decay: float, sustain: float, release: float
+) -> np.ndarray:
+    """
+    Generate an ADSR (Attack, Decay, Sustain, Release) envelope.
+
+    Args:
+        length: Total length in samples
+        sr: Sample rate
+        attack: Attack time in seconds
+        decay: Decay time in seconds
+        sustain: Sustain level (0-1)
+        release: Release time in seconds
+    """
+    return fill_adsr(np.empty(length, dtype=np.float32), length, sr, attack, decay, sustain, release)
+
+
 def generate_instrument_tone(
-    freq: float, duration: float, sr: int, instrument: str = "piano"
+    freq: float,
+    duration: float,
+    sr: int,
+    instrument: str = "piano",
+    rng: Optional[np.random.Generator] = None
 ) -> np.ndarray:
     """
     Generate an instrument tone using additive synthesis.
@@ -156,28 +248,40 @@ def generate_instrument_tone(
         duration: Duration in seconds
         sr: Sample rate
         instrument: Instrument name (piano, guitar, strings, bells, synth, pads)
+        rng: Generator for the detuning (the shared one by default)
     """
     if instrument not in INSTRUMENTS:
         instrument = "piano"
 
     instrument_config = INSTRUMENTS[instrument]
+    mults, amps = HARMONIC_PROFILES[instrument]
     n_samples = int(duration * sr)
-    t = np.linspace(0, duration, n_samples, False)
 
-    # Generate tone using additive synthesis (sum of harmonics)
+    # Generate tone using additive synthesis (sum of harmonics). The phase
+    # and partial buffers are reused for every harmonic.
+    ramp = np.arange(n_samples, dtype=np.float64)
+    phase = np.empty(n_samples, dtype=np.int64)
+    partial = np.empty(n_samples, dtype=np.float32)
     tone = np.zeros(n_samples, dtype=np.float32)
 
-    for harmonic_mult, amplitude in instrument_config["harmonics"]:
-        harmonic_freq = freq * harmonic_mult
-        # Add slight detuning for warmth
-        detune = np.random.uniform(-0.5, 0.5)
-        tone += amplitude * np.sin(2 * np.pi * (harmonic_freq + detune) * t)
+    # Slight detuning of every harmonic for warmth, drawn in one call
+    detunes = (rng or _rng).uniform(-0.5, 0.5, len(mults)).tolist()
 
-    # Normalize the harmonics
-    tone = tone / len(instrument_config["harmonics"])
+    for harmonic_mult, amplitude, detune in zip(mults, amps, detunes):
+        harmonic_freq = freq * float(harmonic_mult)
 
-    # Apply ADSR envelope
-    envelope = generate_adsr_envelope(
+        # Phase accumulator into the wavetable
+        step = (harmonic_freq + detune) * WAVETABLE_SIZE / sr
+        np.multiply(ramp, step, out=phase, casting="unsafe")
+        phase &= WAVETABLE_SIZE - 1
+
+        np.take(_SINE_TABLE, phase, out=partial)
+        partial *= amplitude
+        tone += partial
+
+    # Apply ADSR envelope, written into the partial buffer (free by now)
+    envelope = fill_adsr(
+        partial,
         n_samples,
         sr,
         instrument_config["attack"],
@@ -186,63 +290,219 @@ def generate_instrument_tone(
         instrument_config["release"],
     )
 
-    tone = tone * envelope
+    tone *= envelope
 
-    # Apply brightness (simple low-pass filter simulation)
+    # Apply brightness: darker instruments go through a low-pass filter
     brightness = instrument_config["brightness"]
     if brightness < 1.0:
-        # Soften high frequencies
-        tone = tone * (1.0 - (1.0 - brightness) * 0.3)
+        lowpass(tone, brightness)
 
     return tone
 
 
+def lowpass(x: np.ndarray, a: float, state: float = 0.0) -> float:
+    """
+    Apply the one-pole low-pass filter ``y[n] = a*x[n] + (1-a)*y[n-1]`` in place.
+
+    Args:
+        x: Samples to filter
+        a: Smoothing coefficient in (0, 1]; smaller is darker
+        state: Previous output sample, to continue across buffers
+
+    Returns:
+        The filter state to pass in with the next buffer
+    """
+    if len(x) == 0:
+        return state
+    if WAVETABLE_KERNEL_AVAILABLE:
+        return onepole(x, a, x, state)
+    x[:], _ = lfilter([a], [1.0, a - 1.0], x, zi=[(1.0 - a) * state])
+    return float(x[-1])
+
+
 def notes_to_wav(
-    notes: List[Dict], out_path: Path, sr: int = 44100, instrument: str = "piano"
+    notes: np.ndarray, out_path: Path, sr: int = 44100, instrument: str = "piano"
 ) -> None:
     """
     Render notes to a WAV file using the specified instrument.
 
+    Audio is rendered and written in blocks of WAV_BLOCK_SIZE samples, so
+    memory use does not grow with the length of the melody. The blocks are
+    rendered twice: once to measure the peak, then again to write them
+    normalized to it.
+
     Args:
-        notes: List of note dictionaries with 'midi', 'start', and 'end' keys
+        notes: Note array (NOTE_DTYPE)
         out_path: Output file path
         sr: Sample rate (default: 44100)
         instrument: Instrument type (piano, guitar, strings, bells, synth, pads)
     """
-    if not notes:
+    if len(notes) == 0:
         raise ValueError("No notes to render")
 
-    max_time = max(n["end"] for n in notes)
-    total_samples = int(sr * (max_time + 0.5))
-    audio = np.zeros(total_samples, dtype=np.float32)
-
-    for n in notes:
-        start_sample = int(sr * n["start"])
-        end_sample = int(sr * n["end"])
-        end_sample = max(end_sample, start_sample + 1)
-
-        duration = (end_sample - start_sample) / sr
-        freq = midi_to_freq(int(n["midi"]))
-
-        # Generate instrument tone
-        tone = generate_instrument_tone(freq, duration, sr, instrument)
-
-        # Ensure tone length matches exactly
-        tone = tone[:end_sample - start_sample]
-
-        # Mix into audio buffer
-        audio[start_sample:start_sample + len(tone)] += tone * 0.5
-
-    # Normalize to prevent clipping
-    max_val = np.max(np.abs(audio))
-    if max_val > 0:
-        audio = audio / max_val * 0.85  # Leave some headroom
+    if instrument not in INSTRUMENTS:
+        instrument = "piano"
 
-    audio_int16 = (audio * 32767).astype(np.int16)
+    instrument_config = INSTRUMENTS[instrument]
+    mults, amps = HARMONIC_PROFILES[instrument]
+
+    notes = notes[np.argsort(notes["start"], kind="stable")]
+    total_samples = int(sr * (notes["end"].max() + 0.5))
+
+    start_samples = (sr * notes["start"]).astype(np.int64)
+    end_samples = np.maximum((sr * notes["end"]).astype(np.int64), start_samples + 1)
+    durations = (end_samples - start_samples) / sr
+    # Same sample count generate_instrument_tone derives from the duration
+    lengths = (durations * sr).astype(np.int64)
+
+    # Mix level
+    note_gain = 0.5
+
+    # Blocks only look at notes that can overlap them: starts are sorted,
+    # and the running maximum of the ends is too
+    note_ends = np.maximum.accumulate(start_samples + lengths)
+
+    if WAVETABLE_KERNEL_AVAILABLE:
+        mix_block = _kernel_block_mixer(
+            notes, start_samples, lengths, sr, instrument_config, mults, amps, note_gain
+        )
+    else:
+        mix_block = _tone_block_mixer(notes, start_samples, durations, sr, instrument, note_gain)
+
+    # The kernel renders unfiltered notes, so the brightness low-pass runs
+    # over the mix instead (the filter is linear, so this is the same as
+    # filtering every note, except that tails may ring past a note's end).
+    # generate_instrument_tone filters its tones already.
+    brightness = instrument_config["brightness"]
+    filter_mix = WAVETABLE_KERNEL_AVAILABLE and brightness < 1.0
+
+    block = np.empty(WAV_BLOCK_SIZE, dtype=np.float32)
+    pcm_block = np.empty(WAV_BLOCK_SIZE, dtype=np.int16)
+
+    def render_blocks():
+        """Mix every block in turn, reusing the one block buffer."""
+        filter_state = 0.0
+        for block_start in range(0, total_samples, WAV_BLOCK_SIZE):
+            out = block[:min(WAV_BLOCK_SIZE, total_samples - block_start)]
+            out.fill(0.0)
+
+            first = int(np.searchsorted(note_ends, block_start, side="right"))
+            last = int(np.searchsorted(start_samples, block_start + len(out), side="left"))
+            if first < last:
+                mix_block(out, block_start, first, last)
+            if filter_mix:
+                filter_state = lowpass(out, brightness, filter_state)
+
+            yield out
+
+    # Peak pass: render once without writing anything, so the output can
+    # be normalized to the true peak
+    peak = 0.0
+    for out in render_blocks():
+        peak = max(peak, float(out.max()), -float(out.min()))
+    scale = 0.85 * 32767 / peak if peak > 0 else 0.0
 
-    # Write WAV
     with wave.open(str(out_path), "w") as wf:
         wf.setnchannels(1)
         wf.setsampwidth(2)  # 16-bit
         wf.setframerate(sr)
-        wf.writeframes(audio_int16.tobytes())
+
+        for out in render_blocks():
+            # Scale and round to the nearest sample value in float32, then
+            # convert into the reused int16 buffer (no clipping needed)
+            out *= scale
+            np.rint(out, out=out)
+            pcm = pcm_block[:len(out)]
+            np.copyto(pcm, out, casting="unsafe")
+            wf.writeframes(pcm)
+
+
+def _kernel_block_mixer(
+    notes: np.ndarray,
+    start_samples: np.ndarray,
+    lengths: np.ndarray,
+    sr: int,
+    instrument_config: dict,
+    mults: np.ndarray,
+    amps: np.ndarray,
+    gain: float
+):
+    """Block mixer backed by the compiled wavetable kernel."""
+    freqs = 440.0 * 2.0 ** ((notes["midi"] - 69) / 12.0)
+
+    # Slight per-harmonic detuning for warmth, fixed per note so that notes
+    # spanning several blocks stay continuous
+    detunes = _rng.uniform(-0.5, 0.5, size=(len(notes), len(mults)))
+
+    attack = int(instrument_config["attack"] * sr)
+    decay = int(instrument_config["decay"] * sr)
+    sustain = instrument_config["sustain"]
+    release = int(instrument_config["release"] * sr)
+
+    def mix_block(out: np.ndarray, block_start: int, first: int, last: int) -> None:
+        render_notes(
+            out,
+            block_start,
+            first,
+            last,
+            start_samples,
+            lengths,
+            freqs,
+            detunes,
+            mults,
+            amps,
+            _SINE_TABLE,
+            sr,
+            attack,
+            decay,
+            sustain,
+            release,
+            gain,
+        )
+
+    return mix_block
+
+
+def _tone_block_mixer(
+    notes: np.ndarray,
+    start_samples: np.ndarray,
+    durations: np.ndarray,
+    sr: int,
+    instrument: str,
+    gain: float
+):
+    """Block mixer that renders each note with generate_instrument_tone."""
+    midis = notes["midi"].tolist()
+    starts = start_samples.tolist()
+    durations = durations.tolist()
+
+    # notes_to_wav renders every block twice, so each note's detuning is
+    # seeded from the note index to come out the same both times
+    seed = int(_rng.integers(2**63))
+
+    # Tones of notes that are still sounding, by note index
+    active = {}
+
+    def mix_block(out: np.ndarray, block_start: int, first: int, last: int) -> None:
+        block_end = block_start + len(out)
+
+        for k in range(first, last):
+            start = starts[k]
+            tone = active.get(k)
+            if tone is None:
+                if start < block_start:
+                    continue  # Already finished in an earlier block
+                rng = np.random.default_rng((seed, k))
+                tone = generate_instrument_tone(midi_to_freq(midis[k]), durations[k], sr, instrument, rng)
+                tone *= gain
+                active[k] = tone
+
+            # Mix the part of the tone inside the block
+            lo = max(block_start, start)
+            hi = min(block_end, start + len(tone))
+            out[lo - block_start:hi - block_start] += tone[lo - start:hi - start]
+
+            if start + len(tone) <= block_end:
+                del active[k]
+
+    return mix_block
@@ -1,9 +1,9 @@
 """
 Music theory utilities for key detection and scale quantization.
 """
+from functools import lru_cache
 from typing import List, Dict, Tuple
 import numpy as np
-from collections import Counter
 
 
 # Define all scales as semitone intervals from the root note
@@ -43,64 +43,104 @@ SCALES = {
 }
 
 
+# Each scale as a 12-bit mask, bit i set when i semitones above the root
+# is in the scale
+SCALE_BITMASKS = {
+    name: sum(1 << interval for interval in intervals)
+    for name, intervals in SCALES.items()
+}
+
+
 # Note names for display
 NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
 
+# Pitch class (0-11) of each note name
+_NOTE_INDEX = {name: i for i, name in enumerate(NOTE_NAMES)}
+
+
+# Scales tried by detect_key, in tie-breaking order
+KEY_DETECTION_SCALES = ["major", "minor", "harmonic_minor", "minor_pentatonic",
+                        "major_pentatonic", "dorian", "phrygian"]
+
+# One row per scale: +1 for pitch classes (relative to the root) in the
+# scale, -0.5 to penalize the ones outside it
+_KEY_SCALE_MASKS = np.where(
+    (np.array([SCALE_BITMASKS[name] for name in KEY_DETECTION_SCALES])[:, None]
+     >> np.arange(12)) & 1,
+    1.0,
+    -0.5,
+)
+
+# _CIRCULANT_INDEX[p, root] is the absolute pitch class root + p
+_CIRCULANT_INDEX = (np.arange(12)[:, None] + np.arange(12)[None, :]) % 12
 
-def detect_key(notes: List[Dict]) -> Tuple[str, str]:
+
+def detect_key(notes: np.ndarray) -> Tuple[str, str]:
     """
-    Detect the most likely key and scale from a list of notes.
+    Detect the most likely key and scale from a set of notes.
 
     Args:
-        notes: List of note dictionaries with 'midi' key
+        notes: Note array (NOTE_DTYPE)
 
     Returns:
         Tuple of (root_note, scale_name) e.g., ("C", "major")
     """
-    if not notes:
+    if len(notes) == 0:
         return ("C", "minor")
 
     # Count note frequencies (weighted by duration)
-    pitch_class_weights = Counter()
-
-    for note in notes:
-        duration = note["end"] - note["start"]
-        pitch_class = note["midi"] % 12
-        pitch_class_weights[pitch_class] += duration
-
-    # Try all 12 keys with common scales
-    best_score = -1
-    best_key = ("C", "minor")
-
-    scales_to_try = ["major", "minor", "harmonic_minor", "minor_pentatonic",
-                     "major_pentatonic", "dorian", "phrygian"]
-
-    for root in range(12):
-        for scale_name in scales_to_try:
-            scale = SCALES[scale_name]
+    pitch_class_weights = np.bincount(
+        notes["midi"] % 12,
+        weights=notes["end"] - notes["start"],
+        minlength=12,
+    )
+
+    total_weight = pitch_class_weights.sum()
+    if total_weight <= 0:
+        return ("C", "major")
+
+    # Score every (scale, root) pair at once: column root of the circulant
+    # holds the weights rotated so that index 0 is the root
+    scores = _KEY_SCALE_MASKS @ pitch_class_weights[_CIRCULANT_INDEX]
+    scores /= total_weight
+
+    # First best key in root-major order; the tolerance keeps keys with the
+    # same pitch set (e.g. relative pentatonics) from being decided by
+    # rounding noise
+    by_root = scores.T.ravel()
+    best = int(np.flatnonzero(by_root >= by_root.max() - 1e-9)[0])
+    root, scale_row = divmod(best, len(KEY_DETECTION_SCALES))
+
+    return (NOTE_NAMES[root], KEY_DETECTION_SCALES[scale_row])
+
+
+@lru_cache(maxsize=256)
+def _pitch_class_lut(root: str, scale: str) -> Tuple[int, ...]:
+    """Quantized pitch class for each of the 12 pitch classes."""
+    # Get root note number (0-11)
+    root_num = _NOTE_INDEX.get(root, 0)
 
-            # Calculate how well the notes fit this scale
-            score = 0
-            total_weight = sum(pitch_class_weights.values())
+    # Get scale intervals
+    if scale not in SCALES:
+        scale = "minor"
+    scale_intervals = SCALES[scale]
+    scale_mask = SCALE_BITMASKS[scale]
 
-            for pitch_class, weight in pitch_class_weights.items():
-                # Check if this pitch class is in the scale
-                relative_pitch = (pitch_class - root) % 12
-                if relative_pitch in scale:
-                    score += weight
-                else:
-                    # Penalize notes outside the scale
-                    score -= weight * 0.5
+    lut = [0] * 12
+    for pitch_class in range(12):
+        # Find relative pitch from root
+        relative_pitch = (pitch_class - root_num) % 12
 
-            # Normalize score
-            if total_weight > 0:
-                score = score / total_weight
+        # Notes already in the scale stay where they are
+        if (scale_mask >> relative_pitch) & 1:
+            lut[pitch_class] = pitch_class
+            continue
 
-            if score > best_score:
-                best_score = score
-                best_key = (NOTE_NAMES[root], scale_name)
+        # Find nearest scale degree (the lower one on ties)
+        closest = min(scale_intervals, key=lambda d: abs(d - relative_pitch))
+        lut[pitch_class] = (root_num + closest) % 12
 
-    return best_key
+    return tuple(lut)
 
 
 def quantize_to_scale(midi_note: int, root: str = "C", scale: str = "minor") -> int:
@@ -115,47 +155,44 @@ def quantize_to_scale(midi_note: int, root: str = "C", scale: str = "minor") ->
     Returns:
         Quantized MIDI note number
     """
-    # Get root note number (0-11)
-    if root not in NOTE_NAMES:
-        root = "C"
-    root_num = NOTE_NAMES.index(root)
+    # Keep the octave, look the pitch class up in the 12-entry table
+    octave, pitch_class = divmod(midi_note, 12)
+    return octave * 12 + _pitch_class_lut(root, scale)[pitch_class]
 
-    # Get scale intervals
-    if scale not in SCALES:
-        scale = "minor"
-    scale_intervals = SCALES[scale]
 
-    # Calculate octave and pitch class
-    octave = midi_note // 12
-    pitch_class = midi_note % 12
+@lru_cache(maxsize=256)
+def scale_lut(root: str = "C", scale: str = "minor") -> np.ndarray:
+    """
+    Build a lookup table of quantize_to_scale for every MIDI note.
 
-    # Find relative pitch from root
-    relative_pitch = (pitch_class - root_num) % 12
+    Index it with MIDI numbers clipped to 0-127 to quantize a whole array
+    at once: ``scale_lut(root, scale)[np.clip(midis, 0, 127)]``.
 
-    # Find nearest scale degree
-    closest = min(scale_intervals, key=lambda d: abs(d - relative_pitch))
+    Args:
+        root: Root note name (e.g., "C", "D#", "F")
+        scale: Scale name (e.g., "major", "minor", "afrobeat")
 
-    # Reconstruct MIDI note
-    quantized_pitch = (root_num + closest) % 12
-    return octave * 12 + quantized_pitch
+    Returns:
+        Read-only array of 128 quantized MIDI note numbers
+    """
+    return np.frombuffer(
+        bytes(quantize_to_scale(m, root, scale) for m in range(128)), dtype=np.uint8
+    )
 
 
-def transpose_notes(notes: List[Dict], semitones: int) -> List[Dict]:
+def transpose_notes(notes: np.ndarray, semitones: int) -> np.ndarray:
     """
     Transpose all notes by a specified number of semitones.
 
     Args:
-        notes: List of note dictionaries
+        notes: Note array (NOTE_DTYPE)
         semitones: Number of semitones to transpose (positive or negative)
 
     Returns:
-        New list of transposed notes
+        New array of transposed notes
     """
-    transposed = []
-    for note in notes:
-        new_note = note.copy()
-        new_note["midi"] = max(0, min(127, note["midi"] + semitones))
-        transposed.append(new_note)
+    transposed = notes.copy()
+    transposed["midi"] = np.clip(notes["midi"].astype(np.int64) + semitones, 0, 127)
     return transposed
 
 
@@ -0,0 +1,63 @@
+"""
+Structured-array note representation shared by the melody pipeline.
+"""
+from typing import List, Dict
+import numpy as np
+
+
+# One record per note: MIDI note number, start and end time in seconds
+NOTE_DTYPE = np.dtype([
+    ("midi", np.int16),
+    ("start", np.float64),
+    ("end", np.float64),
+])
+
+
+def empty_notes(size: int = 0) -> np.ndarray:
+    """
+    Allocate an uninitialized note array.
+
+    Args:
+        size: Number of notes
+
+    Returns:
+        Structured array with NOTE_DTYPE
+    """
+    return np.empty(size, dtype=NOTE_DTYPE)
+
+
+def notes_from_dicts(notes: List[Dict]) -> np.ndarray:
+    """
+    Convert a list of {"midi", "start", "end"} dicts to a note array.
+
+    Args:
+        notes: List of note dictionaries
+
+    Returns:
+        Structured array with NOTE_DTYPE
+    """
+    arr = empty_notes(len(notes))
+    arr["midi"] = [n["midi"] for n in notes]
+    arr["start"] = [n["start"] for n in notes]
+    arr["end"] = [n["end"] for n in notes]
+    return arr
+
+
+def notes_to_dicts(notes: np.ndarray) -> List[Dict]:
+    """
+    Convert a note array to a list of dicts with native Python values.
+
+    Args:
+        notes: Structured array with NOTE_DTYPE
+
+    Returns:
+        List of {"midi": int, "start": float, "end": float}
+    """
+    return [
+        {"midi": m, "start": s, "end": e}
+        for m, s, e in zip(
+            notes["midi"].tolist(),
+            notes["start"].tolist(),
+            notes["end"].tolist(),
+        )
+    ]
@@ -0,0 +1,11 @@
+"""
+Numba configuration shared by the compiled kernels.
+
+Importing this module applies it, so every kernel module imports it before
+its first parallel launch.
+"""
+import numba
+
+# TBB can hang the interpreter on exit once parallel kernels have been
+# launched from worker threads, so prefer OpenMP when it is available
+numba.config.THREADING_LAYER_PRIORITY = ["omp", "tbb", "workqueue"]
@@ -0,0 +1,147 @@
+"""
+Numba-accelerated pitch tracking using the normalized cross-correlation
+function (NCCF), in the spirit of the RAPT pitch detector.
+
+Unlike librosa.yin, which returns a pitch for every frame, frames of
+silence, breath or noise come out unvoiced (NaN), so extracted notes end
+at pauses instead of carrying on through them.
+"""
+import numpy as np
+from numba import njit, prange
+
+import numba_setup  # noqa: F401  (selects the threading layer)
+
+# Frames whose best NCCF peak falls below this are treated as unvoiced
+VOICING_THRESHOLD = 0.45
+
+# Prefer the shortest lag whose peak is within this fraction of the best
+# peak, which avoids locking onto multiples of the true period
+OCTAVE_TOLERANCE = 0.9
+
+
+@njit(nogil=True, cache=True)
+def _median_smooth(f0: np.ndarray) -> np.ndarray:
+    """Median-of-5 smoothing over voiced frames (unvoiced frames stay NaN)."""
+    n = f0.shape[0]
+    out = np.empty_like(f0)
+    window = np.empty(5, dtype=f0.dtype)
+
+    for i in range(n):
+        if np.isnan(f0[i]):
+            out[i] = f0[i]
+            continue
+
+        count = 0
+        for j in range(max(0, i - 2), min(n, i + 3)):
+            if not np.isnan(f0[j]):
+                window[count] = f0[j]
+                count += 1
+
+        out[i] = np.sort(window[:count])[count // 2]
+
+    return out
+
+
+@njit(parallel=True, fastmath=True, nogil=True, cache=True)
+def nccf_pitch(
+    y: np.ndarray, sr: int, frame_len: int, hop: int, fmin: float, fmax: float
+) -> np.ndarray:
+    """
+    Estimate the fundamental frequency of every frame of a mono signal.
+
+    Frames are centered like librosa's (padded by frame_len // 2), so the
+    output lines up with ``librosa.times_like(f0, sr=sr, hop_length=hop)``.
+
+    Args:
+        y: Mono audio signal
+        sr: Sample rate
+        frame_len: Frame length in samples
+        hop: Hop length in samples
+        fmin: Minimum frequency in Hz
+        fmax: Maximum frequency in Hz
+
+    Returns:
+        f0 per frame in Hz, NaN for unvoiced frames
+    """
+    pad = frame_len // 2
+    padded = np.zeros(y.shape[0] + 2 * pad, dtype=np.float32)
+    padded[pad:pad + y.shape[0]] = y
+
+    n_frames = 1 + y.shape[0] // hop
+    lag_min = max(1, int(sr / fmax))
+    lag_max = min(int(sr / fmin), frame_len - 2)
+    # Correlation window of half a frame, as librosa.yin uses by default
+    window = min(frame_len // 2, frame_len - lag_max)
+    # One extra lag below lag_min, only used as the left neighbour of the
+    # first lag, so a peak there must actually be a peak (low tones are
+    # still falling from lag 0 at lag_min)
+    guard = 1 if lag_min > 1 else 0
+    lag_lo = lag_min - guard
+    n_lags = lag_max - lag_lo + 1
+
+    f0 = np.empty(n_frames, dtype=np.float64)
+
+    for i in prange(n_frames):
+        x = padded[i * hop:i * hop + frame_len]
+
+        energy0 = 0.0
+        for j in range(window):
+            energy0 += x[j] * x[j]
+
+        if energy0 < 1e-8:
+            f0[i] = np.nan
+            continue
+
+        # Energy of the lagged window, updated as a running sum
+        energy_lag = 0.0
+        for j in range(lag_lo, lag_lo + window):
+            energy_lag += x[j] * x[j]
+
+        nccf = np.zeros(n_lags, dtype=np.float64)
+        best = 0.0
+        for k in range(n_lags):
+            lag = lag_lo + k
+            corr = np.float32(0.0)
+            for j in range(window):
+                corr += x[j] * x[j + lag]
+
+            denom = np.sqrt(energy0 * energy_lag)
+            if denom > 0.0:
+                nccf[k] = corr / denom
+                if k >= guard and nccf[k] > best:
+                    best = nccf[k]
+
+            if lag + window < frame_len:
+                energy_lag += x[lag + window] * x[lag + window] - x[lag] * x[lag]
+
+        if best < VOICING_THRESHOLD:
+            f0[i] = np.nan
+            continue
+
+        # Shortest-lag local peak close enough to the best one. It has to
+        # rise from its left neighbour; the last lag may still be rising.
+        peak = -1
+        for k in range(guard, n_lags):
+            left = nccf[k - 1] if k > 0 else -1.0
+            right = nccf[k + 1] if k < n_lags - 1 else -1.0
+            if nccf[k] >= OCTAVE_TOLERANCE * best and nccf[k] > left and nccf[k] >= right:
+                peak = k
+                break
+
+        if peak < 0:
+            f0[i] = np.nan
+            continue
+
+        # Parabolic interpolation around the peak for sub-sample precision
+        lag_est = float(lag_lo + peak)
+        if 0 < peak < n_lags - 1:
+            a = nccf[peak - 1]
+            b = nccf[peak]
+            c = nccf[peak + 1]
+            curvature = a - 2.0 * b + c
+            if curvature < 0.0:
+                lag_est += 0.5 * (a - c) / curvature
+
+        f0[i] = sr / lag_est
+
+    return _median_smooth(f0)
@@ -1,32 +1,36 @@
 """
 Rhythm processing and quantization utilities.
 """
-from typing import List, Dict
 import numpy as np
+from notes import empty_notes
+
+
+# Shared generator for humanization
+_rng = np.random.default_rng()
 
 
 def quantize_rhythm(
-    notes: List[Dict],
+    notes: np.ndarray,
     grid: str = "1/8",
     bpm: float = 120,
     humanize: float = 0.0,
     groove_template: str = "straight"
-) -> List[Dict]:
+) -> np.ndarray:
     """
     Quantize note timings to a rhythmic grid.
 
     Args:
-        notes: List of note dictionaries with 'start', 'end', 'midi' keys
+        notes: Note array (NOTE_DTYPE)
         grid: Quantization grid - "1/4", "1/8", "1/16", "1/32"
         bpm: Tempo in beats per minute
         humanize: Amount of humanization (0.0 = strict, 1.0 = loose)
         groove_template: Groove pattern - "straight", "swing", "afrobeat", "trap"
 
     Returns:
-        New list of quantized notes
+        New array of quantized notes, sorted by start time
     """
-    if not notes:
-        return []
+    if len(notes) == 0:
+        return empty_notes()
 
     # Calculate grid size in seconds
     beat_duration = 60.0 / bpm
@@ -41,56 +45,75 @@ def quantize_rhythm(
     # Get groove pattern
     groove = get_groove_pattern(groove_template, grid)
 
-    quantized_notes = []
-
-    for i, note in enumerate(notes):
-        start = note["start"]
-        end = note["end"]
-        duration = end - start
+    starts = notes["start"]
+    durations = notes["end"] - starts
 
-        # Find nearest grid position
-        grid_position = round(start / grid_size)
-        quantized_start = grid_position * grid_size
+    # Find nearest grid position
+    grid_positions = np.round(starts / grid_size).astype(np.int64)
+    quantized_starts = grid_positions * grid_size
 
-        # Apply groove swing
-        groove_index = grid_position % len(groove)
-        swing_offset = groove[groove_index] * grid_size
-        quantized_start += swing_offset
+    # Apply groove swing
+    quantized_starts += groove[grid_positions % len(groove)] * grid_size
 
-        # Apply humanization (random variation)
-        if humanize > 0:
-            max_deviation = grid_size * 0.3 * humanize
-            random_offset = np.random.uniform(-max_deviation, max_deviation)
-            quantized_start += random_offset
+    # Apply humanization (random variation)
+    if humanize > 0:
+        max_deviation = grid_size * 0.3 * humanize
+        quantized_starts += _rng.uniform(-max_deviation, max_deviation, len(notes))
 
-        # Quantize duration to grid
-        duration_grids = max(1, round(duration / grid_size))
-        quantized_end = quantized_start + (duration_grids * grid_size)
+    # Quantize duration to grid
+    duration_grids = np.maximum(1, np.round(durations / grid_size))
+    quantized_ends = quantized_starts + duration_grids * grid_size
 
-        # Ensure non-negative start time
-        quantized_start = max(0.0, quantized_start)
-        quantized_end = max(quantized_start + 0.05, quantized_end)
+    # Ensure non-negative start time
+    np.maximum(quantized_starts, 0.0, out=quantized_starts)
+    np.maximum(quantized_ends, quantized_starts + 0.05, out=quantized_ends)
 
-        quantized_notes.append({
-            "midi": note["midi"],
-            "start": quantized_start,
-            "end": quantized_end,
-        })
+    quantized = empty_notes(len(notes))
+    quantized["midi"] = notes["midi"]
+    quantized["start"] = quantized_starts
+    quantized["end"] = quantized_ends
 
     # Sort by start time
-    quantized_notes.sort(key=lambda n: n["start"])
+    quantized = quantized[np.argsort(quantized["start"], kind="stable")]
 
     # Normalize to start at 0
-    if quantized_notes:
-        first_start = quantized_notes[0]["start"]
-        for note in quantized_notes:
-            note["start"] -= first_start
-            note["end"] -= first_start
+    first_start = quantized["start"][0]
+    quantized["start"] -= first_start
+    quantized["end"] -= first_start
+
+    return quantized
+
+
+def _frozen(offsets: list) -> np.ndarray:
+    """Read-only float64 array of groove offsets."""
+    arr = np.array(offsets, dtype=np.float64)
+    arr.flags.writeable = False
+    return arr
+
+
+# Groove swing offsets per grid step (as fractions of a grid step),
+# kept as read-only arrays so quantize_rhythm can index them directly
+_GROOVE_PATTERNS = {
+    "straight": _frozen([0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]),
+
+    # Classic swing - every other note is delayed
+    "swing": _frozen([0.0, 0.15, 0.0, 0.15, 0.0, 0.15, 0.0, 0.15]),
+
+    # Afrobeat - syncopated, emphasis on off-beats
+    "afrobeat": _frozen([0.0, 0.05, 0.1, 0.0, 0.08, 0.0, 0.12, 0.05]),
+
+    # Trap - triplet feel with delayed hi-hats
+    "trap": _frozen([0.0, 0.0, 0.2, 0.0, 0.1, 0.0, 0.15, 0.0]),
+
+    # Shuffle - strong triplet swing
+    "shuffle": _frozen([0.0, 0.25, 0.0, 0.25, 0.0, 0.25, 0.0, 0.25]),
 
-    return quantized_notes
+    # Drunk/humanized - slightly random
+    "drunk": _frozen([0.02, -0.03, 0.04, -0.02, 0.03, -0.04, 0.01, -0.01]),
+}
 
 
-def get_groove_pattern(template: str, grid: str) -> List[float]:
+def get_groove_pattern(template: str, grid: str) -> np.ndarray:
     """
     Get groove swing pattern for different styles.
 
@@ -99,50 +122,29 @@ def get_groove_pattern(template: str, grid: str) -> List[float]:
         grid: Grid size for context
 
     Returns:
-        List of swing offsets (as fractions, 0.0 = no swing)
+        Read-only array of swing offsets (as fractions, 0.0 = no swing)
     """
-    patterns = {
-        "straight": [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
-
-        # Classic swing - every other note is delayed
-        "swing": [0.0, 0.15, 0.0, 0.15, 0.0, 0.15, 0.0, 0.15],
-
-        # Afrobeat - syncopated, emphasis on off-beats
-        "afrobeat": [0.0, 0.05, 0.1, 0.0, 0.08, 0.0, 0.12, 0.05],
-
-        # Trap - triplet feel with delayed hi-hats
-        "trap": [0.0, 0.0, 0.2, 0.0, 0.1, 0.0, 0.15, 0.0],
-
-        # Shuffle - strong triplet swing
-        "shuffle": [0.0, 0.25, 0.0, 0.25, 0.0, 0.25, 0.0, 0.25],
-
-        # Drunk/humanized - slightly random
-        "drunk": [0.02, -0.03, 0.04, -0.02, 0.03, -0.04, 0.01, -0.01],
-    }
-
-    return patterns.get(template, patterns["straight"])
+    return _GROOVE_PATTERNS.get(template, _GROOVE_PATTERNS["straight"])
 
 
 def adjust_note_lengths(
-    notes: List[Dict],
+    notes: np.ndarray,
     style: str = "normal",
     legato: float = 0.95
-) -> List[Dict]:
+) -> np.ndarray:
     """
     Adjust note lengths based on articulation style.
 
     Args:
-        notes: List of note dictionaries
+        notes: Note array (NOTE_DTYPE)
         style: "staccato", "normal", "legato"
         legato: Legato amount (0.0 = very short, 1.0 = full length)
 
     Returns:
         Notes with adjusted durations
     """
-    if not notes:
-        return []
-
-    adjusted = []
+    if len(notes) == 0:
+        return empty_notes()
 
     length_multipliers = {
         "staccato": 0.3,
@@ -152,34 +154,27 @@ def adjust_note_lengths(
 
     multiplier = length_multipliers.get(style, 0.8)
 
-    for i, note in enumerate(notes):
-        new_note = note.copy()
-        duration = note["end"] - note["start"]
-
-        # Calculate new duration
-        new_duration = duration * multiplier
+    # Calculate new duration
+    new_duration = (notes["end"] - notes["start"]) * multiplier
 
-        # For legato, notes can connect to next note
-        if style == "legato" and i < len(notes) - 1:
-            next_start = notes[i + 1]["start"]
-            max_duration = next_start - note["start"]
-            new_duration = min(new_duration, max_duration * legato)
+    # For legato, notes can connect to next note
+    if style == "legato":
+        max_duration = notes["start"][1:] - notes["start"][:-1]
+        new_duration[:-1] = np.minimum(new_duration[:-1], max_duration * legato)
 
-        # Ensure minimum duration
-        new_duration = max(0.05, new_duration)
-
-        new_note["end"] = note["start"] + new_duration
-        adjusted.append(new_note)
+    # Ensure minimum duration
+    adjusted = notes.copy()
+    adjusted["end"] = notes["start"] + np.maximum(0.05, new_duration)
 
     return adjusted
 
 
-def detect_tempo(notes: List[Dict]) -> float:
+def detect_tempo(notes: np.ndarray) -> float:
     """
     Estimate the tempo (BPM) from note timings.
 
     Args:
-        notes: List of note dictionaries
+        notes: Note array (NOTE_DTYPE)
 
     Returns:
         Estimated BPM (defaults to 120 if cannot detect)
@@ -188,8 +183,7 @@ def detect_tempo(notes: List[Dict]) -> float:
         return 120.0
 
     # Calculate inter-onset intervals (time between note starts)
-    onsets = [n["start"] for n in notes]
-    intervals = np.diff(onsets)
+    intervals = np.diff(notes["start"])
 
     # Filter out very short or very long intervals
     intervals = intervals[(intervals > 0.1) & (intervals < 2.0)]
@@ -197,10 +191,13 @@ def detect_tempo(notes: List[Dict]) -> float:
     if len(intervals) == 0:
         return 120.0
 
-    # Find the most common interval (mode)
+    # Find the most common interval (mode) over fixed 0.1s bins spanning 0-2s
     # This is likely the basic beat unit
-    hist, bins = np.histogram(intervals, bins=20)
-    most_common_interval = bins[np.argmax(hist)]
+    bin_idx = np.minimum(19, (intervals / 0.1).astype(np.int64))
+    hist = np.bincount(bin_idx, minlength=20)
+    # Average the intervals in the modal bin rather than taking its centre,
+    # so a steady pulse maps to its own tempo instead of the bin's
+    most_common_interval = intervals[bin_idx == np.argmax(hist)].mean()
 
     # Assume this interval represents a quarter note or eighth note
     # Try both and pick the one that gives a reasonable BPM
@@ -223,22 +220,22 @@ def detect_tempo(notes: List[Dict]) -> float:
 
 
 def apply_groove_template(
-    notes: List[Dict],
+    notes: np.ndarray,
     template: str = "afrobeat",
     intensity: float = 0.5
-) -> List[Dict]:
+) -> np.ndarray:
     """
     Apply a pre-defined groove template to notes.
 
     Args:
-        notes: List of note dictionaries
+        notes: Note array (NOTE_DTYPE)
         template: Template name ("afrobeat", "trap", "swing", etc.)
         intensity: How much to apply the groove (0.0 - 1.0)
 
     Returns:
         Notes with groove applied
     """
-    if not notes or intensity == 0:
+    if len(notes) == 0 or intensity == 0:
         return notes
 
     # Detect tempo first
@@ -256,41 +253,34 @@ def apply_groove_template(
     return grooved
 
 
-def add_triplet_feel(notes: List[Dict], strength: float = 0.5) -> List[Dict]:
+def add_triplet_feel(notes: np.ndarray, strength: float = 0.5) -> np.ndarray:
     """
     Convert notes to have a triplet feel (for trap/hip-hop styles).
 
     Args:
-        notes: List of note dictionaries
+        notes: Note array (NOTE_DTYPE)
         strength: How much triplet feel to apply (0.0 - 1.0)
 
     Returns:
         Notes with triplet timing
     """
-    if not notes or strength == 0:
+    if len(notes) == 0 or strength == 0:
         return notes
 
     bpm = detect_tempo(notes)
-    triplet_notes = []
-
-    for note in notes:
-        # Convert timing to triplet grid
-        beat_duration = 60.0 / bpm
-        triplet_duration = beat_duration / 3
 
-        # Snap to triplet grid
-        triplet_pos = round(note["start"] / triplet_duration)
-        new_start = triplet_pos * triplet_duration
+    # Convert timing to triplet grid
+    beat_duration = 60.0 / bpm
+    triplet_duration = beat_duration / 3
 
-        # Blend between original and triplet timing
-        blended_start = note["start"] * (1 - strength) + new_start * strength
+    # Snap to triplet grid
+    new_start = np.round(notes["start"] / triplet_duration) * triplet_duration
 
-        duration = note["end"] - note["start"]
+    # Blend between original and triplet timing
+    blended_start = notes["start"] * (1 - strength) + new_start * strength
 
-        triplet_notes.append({
-            "midi": note["midi"],
-            "start": blended_start,
-            "end": blended_start + duration,
-        })
+    triplet_notes = notes.copy()
+    triplet_notes["start"] = blended_start
+    triplet_notes["end"] = blended_start + (notes["end"] - notes["start"])
 
     return triplet_notes
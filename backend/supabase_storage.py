@@ -2,16 +2,67 @@
 Supabase storage integration for Melo.
 """
 import os
+import queue
+import threading
+import time
 from pathlib import Path
 from typing import Optional
 from datetime import datetime, timedelta
 
+import anyio
+
 try:
+    import httpx
     from supabase import create_client, Client
     SUPABASE_AVAILABLE = True
 except ImportError:
     SUPABASE_AVAILABLE = False
 
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Uploads are streamed from disk in chunks of this size instead of being
+# read into memory whole
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Metadata rows are buffered and written in one insert once this many are
+# pending or the oldest has waited METADATA_FLUSH_INTERVAL seconds
+METADATA_BATCH_SIZE = 64
+METADATA_FLUSH_INTERVAL = 0.05
+METADATA_QUEUE_SIZE = 4096
+
+
+def _upload_headers(file_path: Path, content_type: str) -> dict:
+    """
+    Request headers for a streamed upload (sized, so it is not chunked).
+
+    Carries the same file options supabase-py sends by default: one hour of
+    caching and no overwriting of existing objects.
+    """
+    return {
+        "Content-Type": content_type,
+        "Content-Length": str(os.stat(file_path).st_size),
+        "Cache-Control": "max-age=3600",
+        "x-upsert": "false",
+    }
+
+
+def _iter_file(file_path: Path):
+    """Yield a file's contents in UPLOAD_CHUNK_SIZE pieces."""
+    with open(file_path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            yield chunk
+
+
+async def _aiter_file(file_path: Path):
+    """Yield a file's contents in UPLOAD_CHUNK_SIZE pieces without blocking."""
+    async with await anyio.open_file(file_path, "rb") as f:
+        while chunk := await f.read(UPLOAD_CHUNK_SIZE):
+            yield chunk
+
 
 class SupabaseStorage:
     """Handle file storage using Supabase."""
@@ -19,9 +70,17 @@ class SupabaseStorage:
     def __init__(self):
         self.enabled = False
         self.client: Optional[Client] = None
+        self._http: Optional["httpx.AsyncClient"] = None
+        self._http_sync: Optional["httpx.Client"] = None
+        self._metadata_queue: "queue.Queue[dict]" = queue.Queue(maxsize=METADATA_QUEUE_SIZE)
+        self._metadata_thread: Optional[threading.Thread] = None
+        self._metadata_lock = threading.Lock()
+        self._http_sync_lock = threading.Lock()
 
         supabase_url = os.getenv("SUPABASE_URL")
         supabase_key = os.getenv("SUPABASE_KEY")
+        self._url = (supabase_url or "").rstrip("/")
+        self._key = supabase_key
 
         if SUPABASE_AVAILABLE and supabase_url and supabase_key:
             try:
@@ -57,24 +116,92 @@ class SupabaseStorage:
             return None
 
         try:
-            with open(file_path, "rb") as f:
-                data = f.read()
-
-            # Upload to Supabase
-            response = self.client.storage.from_(bucket).upload(
-                destination_path,
-                data,
-                {"content-type": content_type}
+            response = self._sync_client().post(
+                f"/object/{bucket}/{destination_path}",
+                content=_iter_file(file_path),
+                headers=_upload_headers(file_path, content_type),
             )
+            response.raise_for_status()
 
             # Get public URL
-            public_url = self.client.storage.from_(bucket).get_public_url(destination_path)
-            return public_url
+            return self.client.storage.from_(bucket).get_public_url(destination_path)
 
         except Exception as e:
             print(f"Error uploading to Supabase: {e}")
             return None
 
+    def _client_options(self) -> dict:
+        """Connection settings shared by the sync and async HTTP clients."""
+        return {
+            "base_url": f"{self._url}/storage/v1",
+            "headers": {"Authorization": f"Bearer {self._key}", "apikey": self._key},
+            "timeout": 30.0,
+        }
+
+    def _sync_client(self) -> "httpx.Client":
+        """Shared sync HTTP client, so uploads reuse pooled connections."""
+        with self._http_sync_lock:
+            if self._http_sync is None:
+                self._http_sync = httpx.Client(**self._client_options())
+            return self._http_sync
+
+    def _async_client(self) -> "httpx.AsyncClient":
+        """Shared async HTTP client, so uploads reuse pooled connections."""
+        if self._http is None:
+            self._http = httpx.AsyncClient(http2=HTTP2_AVAILABLE, **self._client_options())
+        return self._http
+
+    async def upload_file_async(
+        self,
+        bucket: str,
+        file_path: Path,
+        destination_path: str,
+        content_type: str = "application/octet-stream"
+    ) -> Optional[str]:
+        """
+        Upload a file to Supabase Storage without blocking the event loop.
+
+        Goes straight to the Storage REST API, so several uploads can run
+        concurrently (e.g. with asyncio.gather). The file is streamed from
+        disk in UPLOAD_CHUNK_SIZE pieces rather than held in memory.
+
+        Args:
+            bucket: Bucket name (e.g., "melodies", "audio")
+            file_path: Local file path to upload
+            destination_path: Destination path in bucket
+            content_type: MIME type of the file
+
+        Returns:
+            Public URL if successful, None otherwise
+        """
+        if not self.enabled or not self.client:
+            return None
+
+        try:
+            headers = await anyio.to_thread.run_sync(_upload_headers, file_path, content_type)
+            response = await self._async_client().post(
+                f"/object/{bucket}/{destination_path}",
+                content=_aiter_file(file_path),
+                headers=headers,
+            )
+            response.raise_for_status()
+
+            # Get public URL
+            return self.client.storage.from_(bucket).get_public_url(destination_path)
+
+        except Exception as e:
+            print(f"Error uploading to Supabase: {e}")
+            return None
+
+    async def aclose(self):
+        """Close the shared HTTP clients."""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        if self._http_sync is not None:
+            self._http_sync.close()
+            self._http_sync = None
+
     def get_public_url(self, bucket: str, file_path: str) -> Optional[str]:
         """
         Get public URL for a file in Supabase Storage.
@@ -131,31 +258,88 @@ class SupabaseStorage:
         metadata: dict
     ) -> bool:
         """
-        Save melody metadata to Supabase database.
+        Queue melody metadata for saving to Supabase database.
+
+        Rows are written in batches by a background thread (see
+        METADATA_BATCH_SIZE and METADATA_FLUSH_INTERVAL), so this returns
+        without waiting for the network. Call flush() to wait for them.
 
         Args:
             melody_id: Unique melody ID
             metadata: Metadata dictionary
 
         Returns:
-            True if successful, False otherwise
+            True if queued, False otherwise (including when the queue is full)
         """
         if not self.enabled or not self.client:
             return False
 
+        data = {
+            "id": melody_id,
+            "created_at": datetime.utcnow().isoformat(),
+            **metadata
+        }
+
+        self._start_metadata_writer()
+        # Called from the event loop, so never wait for room in the queue
         try:
-            data = {
-                "id": melody_id,
-                "created_at": datetime.utcnow().isoformat(),
-                **metadata
-            }
+            self._metadata_queue.put_nowait(data)
+        except queue.Full:
+            print(f"Metadata queue full, dropping metadata for {melody_id}")
+            return False
+        return True
+
+    def flush(self):
+        """Wait until every queued metadata row has been written."""
+        if self._metadata_thread is not None:
+            self._metadata_queue.join()
+
+    def _start_metadata_writer(self):
+        """Start the background metadata writer on first use."""
+        with self._metadata_lock:
+            if self._metadata_thread is None:
+                self._metadata_thread = threading.Thread(
+                    target=self._metadata_writer, name="supabase-metadata", daemon=True
+                )
+                self._metadata_thread.start()
+
+    def _metadata_writer(self):
+        """Collect queued rows into batches and insert each batch at once."""
+        while True:
+            rows = [self._metadata_queue.get()]
+            deadline = time.monotonic() + METADATA_FLUSH_INTERVAL
+
+            while len(rows) < METADATA_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    rows.append(self._metadata_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
 
-            self.client.table("melodies").insert(data).execute()
-            return True
+            try:
+                self._insert_metadata(rows)
+            finally:
+                for _ in rows:
+                    self._metadata_queue.task_done()
 
+    def _insert_metadata(self, rows: list):
+        """Insert rows in one request, retrying one by one if that fails."""
+        try:
+            self.client.table("melodies").insert(rows).execute()
+            return
         except Exception as e:
-            print(f"Error saving metadata: {e}")
-            return False
+            if len(rows) == 1:
+                print(f"Error saving metadata: {e}")
+                return
+
+        # One bad row fails the whole batch, so don't lose the others
+        for row in rows:
+            try:
+                self.client.table("melodies").insert(row).execute()
+            except Exception as e:
+                print(f"Error saving metadata for {row['id']}: {e}")
 
     def get_melody_metadata(self, melody_id: str) -> Optional[dict]:
         """
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from audio_processing import _SR, _FRAME, _HOP, _FMIN_HZ, _FMAX_HZ
+
+pitch_nccf = pytest.importorskip("pitch_nccf")
+
+
+# Pure sines across the whole search range, C2 (65.4 Hz) to C7 (2093 Hz).
+# Low tones used to lock onto the shortest lag and come out near 2205 Hz.
+@pytest.mark.parametrize("freq", np.geomspace(_FMIN_HZ, _FMAX_HZ, 40).tolist())
+def test_pure_sine_pitch(freq):
+    t = np.arange(_SR) / _SR
+    y = np.sin(2 * np.pi * freq * t).astype(np.float32)
+
+    f0 = pitch_nccf.nccf_pitch(y, _SR, _FRAME, _HOP, _FMIN_HZ, _FMAX_HZ)
+
+    # Skip the padded edge frames
+    estimate = np.nanmedian(f0[4:-4])
+    assert abs(12 * np.log2(estimate / freq)) < 0.5
+
+
+# Unlike librosa.yin, which returns a pitch for every frame, the tracker
+# marks silence and noise unvoiced (NaN), so notes split on pauses
+def test_silence_is_unvoiced():
+    y = np.zeros(_SR, dtype=np.float32)
+
+    f0 = pitch_nccf.nccf_pitch(y, _SR, _FRAME, _HOP, _FMIN_HZ, _FMAX_HZ)
+
+    assert np.isnan(f0).all()
+
+
+def test_white_noise_is_unvoiced():
+    y = np.random.default_rng(0).standard_normal(_SR).astype(np.float32) * 0.5
+
+    f0 = pitch_nccf.nccf_pitch(y, _SR, _FRAME, _HOP, _FMIN_HZ, _FMAX_HZ)
+
+    assert np.isnan(f0).all()
+
+
+def test_voicing_follows_a_pause():
+    t = np.arange(_SR) / _SR
+    y = np.concatenate([np.sin(2 * np.pi * 220.0 * t), np.zeros(_SR)]).astype(np.float32)
+
+    f0 = pitch_nccf.nccf_pitch(y, _SR, _FRAME, _HOP, _FMIN_HZ, _FMAX_HZ)
+
+    n_frames = len(f0) // 2
+    assert np.isfinite(f0[:n_frames - 4]).all()
+    assert np.isnan(f0[n_frames + 4:]).all()
@@ -0,0 +1,142 @@
+"""
+Numba-accelerated additive wavetable synthesis for rendering note lists.
+"""
+import numpy as np
+from numba import njit, prange
+
+import numba_setup  # noqa: F401  (selects the threading layer)
+
+# Blocks are rendered in parallel in sample ranges of this length
+RENDER_CHUNK_SIZE = 1024
+
+
+@njit(parallel=True, fastmath=True, nogil=True, cache=True)
+def render_notes(
+    out: np.ndarray,
+    block_start: int,
+    first: int,
+    last: int,
+    starts: np.ndarray,
+    lengths: np.ndarray,
+    freqs: np.ndarray,
+    detunes: np.ndarray,
+    mults: np.ndarray,
+    amps: np.ndarray,
+    table: np.ndarray,
+    sr: int,
+    attack: int,
+    decay: int,
+    sustain: float,
+    release: int,
+    gain: float,
+) -> None:
+    """
+    Mix notes first..last-1 into one block of output, one pass per note.
+
+    Phase accumulation, wavetable lookup, harmonic mixing, the ADSR envelope
+    and the output gain are fused into one loop over the samples of each
+    note that fall inside the block. Every sample is computed from its
+    position in the note alone, so a note spanning several blocks renders
+    identically to one rendered in a single call. The envelope matches
+    generate_adsr_envelope sample for sample.
+
+    The block is split into RENDER_CHUNK_SIZE sample ranges rendered in
+    parallel (on NUMBA_NUM_THREADS threads). Each range mixes every note
+    into its own part of out, in note order, so no two threads write the
+    same sample and the result does not depend on the number of threads.
+
+    Args:
+        out: Block buffer, mixed into in place
+        block_start: Output sample index of out[0]
+        first: First note to render
+        last: One past the last note to render
+        starts: First output sample of each note
+        lengths: Number of samples of each note
+        freqs: Fundamental frequency of each note in Hz
+        detunes: Per-note, per-harmonic detune in Hz, shape (notes, harmonics)
+        mults: Harmonic frequency multipliers
+        amps: Harmonic amplitudes (already normalized)
+        table: Unit-period sine wavetable, power-of-two length
+        sr: Sample rate
+        attack: Attack time in samples
+        decay: Decay time in samples
+        sustain: Sustain level (0-1)
+        release: Release time in samples
+        gain: Gain applied to every note (mix level)
+    """
+    mask = table.shape[0] - 1
+    n_harmonics = mults.shape[0]
+
+    block_len = out.shape[0]
+    n_chunks = (block_len + RENDER_CHUNK_SIZE - 1) // RENDER_CHUNK_SIZE
+
+    for c in prange(n_chunks):
+        chunk_start = block_start + c * RENDER_CHUNK_SIZE
+        chunk_end = min(block_start + block_len, chunk_start + RENDER_CHUNK_SIZE)
+        steps = np.empty(n_harmonics, dtype=np.float64)
+
+        for k in range(first, last):
+            length = lengths[k]
+            # Part of the note inside this chunk of the block
+            i_begin = max(0, chunk_start - starts[k])
+            i_end = min(length, chunk_end - starts[k])
+            if i_begin >= i_end:
+                continue
+
+            for h in range(n_harmonics):
+                steps[h] = (freqs[k] * mults[h] + detunes[k, h]) * table.shape[0] / sr
+
+            # Envelope regions, applied in the same order as generate_adsr_envelope
+            has_attack = 0 < attack < length
+            has_decay = decay > 0 and attack + decay < length
+            has_release = 0 < release < length
+            sustain_start = attack + decay
+            sustain_end = max(sustain_start, length - release)
+            release_start = length - release
+
+            for i in range(i_begin, i_end):
+                if has_release and i >= release_start:
+                    if release > 1:
+                        env = sustain * (1.0 - (i - release_start) / (release - 1))
+                    else:
+                        env = sustain
+                elif sustain_start <= i < sustain_end:
+                    env = sustain
+                elif has_decay and attack <= i < sustain_start:
+                    if decay > 1:
+                        env = 1.0 + (sustain - 1.0) * (i - attack) / (decay - 1)
+                    else:
+                        env = 1.0
+                elif has_attack and i < attack:
+                    env = i / (attack - 1) if attack > 1 else 0.0
+                else:
+                    env = 1.0
+
+                sample = 0.0
+                for h in range(n_harmonics):
+                    sample += amps[h] * table[np.int64(i * steps[h]) & mask]
+
+                out[starts[k] + i - block_start] += gain * env * sample
+
+
+@njit(fastmath=True, nogil=True, cache=True)
+def onepole(x: np.ndarray, a: float, out: np.ndarray, y: float = 0.0) -> float:
+    """
+    One-pole low-pass filter ``y[n] = a*x[n] + (1-a)*y[n-1]``.
+
+    out may be x itself, to filter in place. Passing the returned state
+    back in as y continues the filter across consecutive buffers.
+
+    Args:
+        x: Input samples
+        a: Smoothing coefficient in (0, 1]; 1 passes x through unchanged
+        out: Output buffer, same length as x
+        y: Filter state (previous output sample)
+
+    Returns:
+        The last output sample, i.e. the state for the next buffer
+    """
+    for i in range(x.shape[0]):
+        y = a * x[i] + (1.0 - a) * y
+        out[i] = y
+    return y